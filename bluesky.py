@@ -1,22 +1,48 @@
 # For handling twitter requests
-import json
 import logging
-from time import sleep
+import re
+from json import JSONDecodeError
+from urllib.parse import urlencode
 
 import requests
-from selenium.common import NoSuchElementException
 from selenium.webdriver.chrome.webdriver import WebDriver
-from selenium.webdriver.common.by import By
+from selenium.webdriver.remote.webelement import WebElement
+
+import httpSession
+from likes import get_likes_str
+from memoryCache import LruCache
+
+# Use the much faster orjson parser if it is available. Otherwise fall back to standard json.
+# Both accept the raw response bytes so no separate decode step is needed.
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
 
 logger = logging.getLogger()
 
+# For getting user_name and post_id from a bluesky post URL. Compiled just once.
+_BLUESKY_POST_RE = re.compile(r'/profile/(\S+)/post/(\S+)')
+
+# For finding just the json encoded string value of the html member of the oembed response
+_HTML_MEMBER_RE = re.compile(rb'"html"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+# Session used for all requests to the Bluesky oembed service, so that the connection to
+# embed.bsky.app is kept alive
+_session = httpSession.create_session('https://embed.bsky.app/')
 
-def bluesky_post_regex():
+# Recently fetched html of posts, keyed by (user_name, post_id). Crawlers often request a post
+# several times before its card is cached, so this avoids fetching the same html again. Kept
+# only for an hour so that the html gets refreshed.
+_post_html_cache = LruCache(max_entries=512, ttl=60 * 60)
+
+
+def bluesky_post_regex() -> re.Pattern:
     """
      For getting user_name and post_id from a bluesky post URL
-    :return: the regex to use
+    :return: the precompiled regex to use
     """
-    return r'/profile/(\S+)/post/(\S+)'
+    return _BLUESKY_POST_RE
 
 
 def get_bluesky_post_html(user_name: str, post_id: str):
@@ -26,128 +52,127 @@ def get_bluesky_post_html(user_name: str, post_id: str):
     :param post_id: of the post
     :return: the html for the post
     """
+    html = _post_html_cache.get((user_name, post_id))
+    if html:
+        logger.info(f'Using remembered bluesky html for user_name={user_name} post_id={post_id}')
+        return html
+
     # Get URL that provides HTML for the post. Using bluesky's oembed service, which returns
     # a json object with a html member.
-    url = (f'https://embed.bsky.app/oembed?' +
-           f'url=https://bsky.app/profile/{user_name}/post/{post_id}&maxwidth=220')
-
-    response = requests.get(url)
-    json_result = json.loads(response.content)
-    return json_result['html']
-
-
-def get_bluesky_likes_str(browser: WebDriver) -> str:
+    # The post URL is encoded since it is itself a query parameter.
+    query = urlencode({'url': f'https://bsky.app/profile/{user_name}/post/{post_id}',
+                       'maxwidth': 220})
+    url = f'https://embed.bsky.app/oembed?{query}'
+
+    logger.info(f'Getting bluesky html by getting url={url}')
+    try:
+        response = _session.get(url, timeout=httpSession.TIMEOUT)
+    except requests.RequestException as e:
+        logger.error(f'Could not get bluesky html from url={url}. {e}')
+        return None
+
+    if not response.ok:
+        logger.error(f'Could not get bluesky html from url={url}. status_code={response.status_code}')
+        return None
+
+    try:
+        html = _extract_html(response.content)
+    except (JSONDecodeError, KeyError) as e:
+        logger.error(f'Could not parse bluesky json from url={url}. {e!r}')
+        return None
+
+    # Only remember a successful response so that an error isn't used for an hour
+    _post_html_cache.put((user_name, post_id), html)
+    return html
+
+
+def _extract_html(content: bytes) -> str:
     """
-    Returns number of likes for a bluesky post. Determines the number by searching XPATH of html
-    for what *appears* to be number of likes.
-    :param browser: so can talk with headless browser
-    :return: a string like "97 &hearts;"
+    Gets the html member from the json oembed response. Only the html string itself is decoded
+    since the other members of the response are not needed. If the html member cannot be found
+    that way then the whole response is parsed.
+    :param content: the body of the oembed response
+    :return: the html for the post
     """
-    logger.info(f'Getting likes string for bluesky post')
-
-    # Initialize return value
-    likes_str = ''
-
-    # Need to just look within the iframe
-    iframe = browser.find_element(By.TAG_NAME, "iframe")
-    browser.switch_to.frame(iframe)
-
-    # Find the html element that contains number of likes
-    xpath_str = '//time/../following-sibling::div//p'
-    likes_span_element = browser.find_element(By.XPATH, xpath_str)
-
-    if likes_span_element:
-        # Find the likes in the html <span> element
-        try:
-            likes_number = browser.execute_script("return arguments[0].innerText", likes_span_element)
-            if likes_number and '1' <= likes_number[0] <= '9':
-                likes_str = f'{likes_number} &#9825;'  # &#9825; is heart outline
-                logger.info(f'Found the likes string={likes_str}')
-        except NoSuchElementException as e:
-            logger.info(f'Could not find the bluesky likes <span> element specified by XPATH={xpath_str}')
-
-    # Switch back to the main frame so that subsequent software not confused
-    browser.switch_to.default_content()
-
-    # Done
-    return likes_str
-
-
-def get_bluesky_post_text(browser: WebDriver) -> str:
+    match = _HTML_MEMBER_RE.search(content)
+    if match:
+        return _json_loads(match.group(1))
+    return _json_loads(content)['html']
+
+
+# Script run within the Bluesky iframe that gets, in a single call, everything needed from the
+# post: the likes text, the post text, and the y positions of the top bar and of the <time>
+# element so that the post can be cropped. Uses querySelector() and simple DOM walking instead
+# of XPath since Chrome's XPath evaluator is much slower. Likes are in what *appears* to be the
+# first paragraph in a <div> that follows the parent of the <time> element. The post text is the
+# first paragraph directly under a <div> instead of an <a>. The top bar is the parent of the first
+# <img> (found that going up two levels didn't work consistently). A position is null if the
+# element could not be found.
+_BLUESKY_INFO_JS = """
+    const y = (element) => element ? element.getBoundingClientRect().top + window.scrollY : null;
+    const time = document.querySelector('time');
+    let likes = null;
+    for (let sibling = time?.parentElement?.nextElementSibling; sibling && !likes;
+         sibling = sibling.nextElementSibling) {
+        if (sibling.tagName === 'DIV') likes = sibling.querySelector('p');
+    }
+    const text = document.querySelector('div > p');
+    return {likes: likes ? likes.innerText : '',
+            text: text ? text.innerText : '',
+            topBarY: y(document.querySelector('img')?.parentElement),
+            timeY: y(time)};
+"""
+
+
+def get_bluesky_post_info(browser: WebDriver,
+                          iframe: WebElement,
+                          iframe_rect: dict) -> tuple[str, str, tuple[int, int, int, int]]:
     """
-    Gets the post text for a bluesky post.
+    Gets the likes string, the post text, and the rectangle of the important part of a bluesky
+    post. Everything is read from within the iframe using a single script, which is much faster
+    than separately finding each element and then reading its text or position.
+    The rectangle uses the least amount of height possible since BlueSky uses fixed aspect ratio
+    for Open Graph cards and if the post is too tall then the image is shrunk down too much. The
+    units of the rectangle are browser pixels, as used for the clip of the screenshot.
     :param browser: so can talk with headless browser
-    :return: post text
+    :param iframe: the iframe that contains the post, as already found when waiting for it to load
+    :param iframe_rect: position and size of the iframe, as x, y, width, and height
+    :return: likes_str like "97 &#9825;", post_text, and the (left, top, right, bottom) coordinates
+    of the important part of the image that should be kept
     """
-    logger.info(f'Getting text for bluesky post')
-
-    # The return value
-    post_text = ''
+    logger.info(f'Getting likes, text, and crop rect for bluesky post')
 
-    # Need to just look within the iframe
-    iframe = browser.find_element(By.TAG_NAME, "iframe")
+    # Read everything from within the iframe. Switch back to the main frame afterwards
+    # so that subsequent software not confused.
     browser.switch_to.frame(iframe)
+    try:
+        info = browser.execute_script(_BLUESKY_INFO_JS)
+    finally:
+        browser.switch_to.default_content()
 
-    # Find the html element that contains text of the main post, which appears to be the first
-    # paragraph element that is directly under a <div> instead of an <a>
-    xpath_str = '//div/p'
-    post_text_span_element = browser.find_element(By.XPATH, xpath_str)
-    if post_text_span_element:
-        # Find the text of the post in the html <span> element
-        try:
-            post_text = browser.execute_script("return arguments[0].innerText", post_text_span_element)
-            if post_text:
-                logger.info(f'Found post text={post_text}')
-        except NoSuchElementException as e:
-            logger.info(f'Could not find the post text <span> element specified by XPATH={xpath_str}')
-
-    # Switch back to the main frame so that subsequent software not confused
-    browser.switch_to.default_content()
-
-    # Could not determine number of likes
-    return post_text
+    likes_str = get_likes_str(info['likes'])
 
-
-def get_bluesky_rect(ratio: float, browser: WebDriver):
-    """
-    Gets the rectangle of the important part of the post. Want to use the least amount of height
-    possible since BlueSky uses fixed aspect ratio for Open Graph cards and if the post is too
-    tall then the image is shrunk down too much. The units are in screen pixels
-    :param ratio: the peculiar pixel ratio to map from Image pixels to browser pixels
-    :param browser: so can talk with headless browser
-    :return:left, top, right, bottom, the coordinates of the important part of the image that should be kept
-    """
-    # Determine the main <article> element
-    iframe = browser.find_element(By.TAG_NAME, 'iframe')
+    post_text = info['text']
+    if post_text:
+        logger.info(f'Found post text={post_text}')
 
     # Determine left and right of the post. Adjusting left and right slightly to
     # not include the border, since it is visually distracting.
-    iframe_rect = iframe.rect
-    left = (iframe_rect['x'] + 1) * ratio
-    right = left + ((iframe_rect['width'] - 2) * ratio)
+    left = iframe_rect['x'] + 1
+    right = left + iframe_rect['width'] - 2
 
-    browser.switch_to.frame(iframe)
-
-    # Determine top. Note: found using //img/../.. didn't work consistently
-    top_bar = browser.find_element(By.XPATH, '//img/..')
-    top = (iframe_rect['y'] + top_bar.rect['y'] - 2) * ratio
+    top_bar_y = info['topBarY'] or 0
+    top = iframe_rect['y'] + top_bar_y - 2
 
     # Determine bottom by using the top of the <time> element
-    time_element = browser.find_element(By.XPATH, '//time')
-    if time_element:
-        bottom = (iframe_rect['y'] + time_element.rect['y'] - 7) * ratio
-        logging.info(f"For Bluesky post <time> element found. time_element.rect['y']={time_element.rect['y']} "
-                     f"and bottom={bottom}")
+    time_y = info['timeY']
+    if time_y is not None:
+        bottom = iframe_rect['y'] + time_y - 7
+        logger.info(f"For Bluesky post <time> element found. time_y={time_y} and bottom={bottom}")
     else:
         # No <time> element so just use height of iframe
-        logging.info(f'<time> element not found so using all of frame')
-        sleep(1.0)
-        time_element = browser.find_element(By.XPATH, '//time')
-        logging.info(f'time_element={time_element}')
-        bottom = top + ((iframe_rect['height'] - 5) * ratio)
-
-    # Switch back to the main frame so that subsequent software not confused
-    browser.switch_to.default_content()
+        logger.info(f'<time> element not found so using all of frame')
+        bottom = top + iframe_rect['height'] - 5
 
     logger.info(f'Bluesky crop rect is left={left}, top={top}, right={right}, bottom={bottom}')
-    return round(left), round(top), round(right), round(bottom)
+    return likes_str, post_text, (round(left), round(top), round(right), round(bottom))
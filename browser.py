@@ -1,188 +1,192 @@
 # For using Chrome browser to convert complicated html to an image
+import base64
 import logging
-import time
 from io import BytesIO
-from typing import Optional
 
 from PIL import Image
-from selenium import webdriver
-from selenium.common import NoSuchElementException
+from selenium.common import JavascriptException, NoSuchElementException, TimeoutException, WebDriverException
 from selenium.webdriver.chrome.webdriver import WebDriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.wait import WebDriverWait
+from selenium.webdriver.remote.webelement import WebElement
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
 
-from bluesky import get_bluesky_likes_str, get_bluesky_post_text, get_bluesky_rect
+import browser_pool
+from bluesky import get_bluesky_post_info
 from main import config_values
 from browserType import PostType
-from threads import get_threads_likes_str, get_threads_post_text, get_threads_rect
-from twitter import get_twitter_likes_str, get_twitter_post_text, get_twitter_rect
+from threads import get_threads_post_info
+from twitter import get_twitter_post_info
 
 logger = logging.getLogger()
 
-# The headless web browser that is used to render the html
-_browser: Optional[WebDriver] = None
 
-
-def _browser_init() -> None:
+def _get_logo_data_uri() -> str:
     """
-    Initializes browser if haven't done so yet
+    Reads the dead twitter logo from the local images directory and encodes it as a data URI so
+    that the browser doesn't have to fetch it over the network. The logo is only displayed at
+    41x38 so it is shrunk first, keeping twice that for high resolution displays, which keeps the
+    data URI small.
+    :return: the data URI for the logo
     """
-    global _browser
-    if _browser is not None:
-        return
-
-    # Options listed at https://www.selenium.dev/documentation/webdriver/drivers/options/
-    options = webdriver.ChromeOptions()
-    # to get rid of warning message at top of page
-    options.add_experimental_option("excludeSwitches", ['enable-automation']);
-    # To run without actual displaying browser window
-    options.add_argument('--headless=new')
-
-    # If chrome_web_browser specified then use it. Otherwise uses selenium default value
-    if config_values['chrome_web_browser']:
-        options.binary_location = config_values['chrome_web_browser']
-
-    # If chrome_webdriver specified then use it. Otherwise uses selenium default value
-    if config_values['chrome_webdriver']:
-        service = webdriver.ChromeService(executable_path=config_values['chrome_webdriver'])
-    else:
-        service = None
-
-    _browser = webdriver.Chrome(options=options, service=service)
-
-    # Note: Chrome only goes down to 400px or 500px width. To get skinnier post need to put the
-    # post html within a <div style="max-width: 399px"> </div> block.
-    _browser.set_window_size(600, 1000)
-
-
-def _make_modifications(post_type: PostType) -> None:
+    with Image.open('images/dead_twitter.png') as img:
+        img.thumbnail((82, 76), Image.Resampling.LANCZOS)
+        buffer = BytesIO()
+        img.save(buffer, format='PNG')
+    return 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+# The replacement logo for twitter posts. Only needs to be encoded once.
+_LOGO_DATA_URI = _get_logo_data_uri()
+
+# Script for execute_async_script() that replaces the contents of the element passed in with the
+# image whose src is passed in, and then calls back once the image has been loaded, or failed to
+# load. Returns true if the image was successfully loaded. Since the src is a data URI the image
+# is typically complete right away, but still need to make sure before taking the screenshot.
+_REPLACE_WITH_IMAGE_JS = """
+    const callback = arguments[arguments.length - 1];
+    const image = document.createElement('img');
+    image.name = 'replacement_logo';
+    image.width = 41;
+    image.height = 38;
+    image.src = arguments[1];
+    arguments[0].replaceChildren(image);
+    if (image.complete) return callback(image.naturalWidth > 0);
+    image.addEventListener('load', () => callback(true), {once: true});
+    image.addEventListener('error', () => callback(false), {once: true});
+"""
+
+
+# For finding the parent <a> element of the X logo, with a CSS selector and, for browsers that
+# don't support :has(), with the equivalent XPath
+_SVG_LOGO_PARENT_JS = "return document.querySelector('article > div a:has(> svg)');"
+_SVG_LOGO_PARENT_XPATH = "//article/div//a/*[name()='svg']/.."
+
+
+def _make_modifications(browser: WebDriver, post_type: PostType, iframe: WebElement | None) -> None:
     """
     Finds the X logo if it is a twitter post and replaces it with a funny old twitter logo.
     Doesn't return until the logo, if found, has been fully replaced and displayed such that
     screenshot can be taken. If not a twitter post then simpily returns
+    :param browser: the browser that has the post loaded
+    :param post_type: so that only twitter posts are modified
+    :param iframe: the iframe that contains the post, or None if there isn't one
     """
-    if post_type != PostType.XITTER:
+    if post_type != PostType.XITTER or iframe is None:
         return
 
-    # Need to just look within the iframe
-    iframe = _browser.find_element(By.TAG_NAME, "iframe")
-    _browser.switch_to.frame(iframe)
-
-    # Find the X logo if it is a twitter post. Then can replace it. There are several svg
-    # icons, but by using find_element() get the first one, which is the one desired. And
-    # note that there is a bug where can't just find a svg element using "svg". Instead, need
-    # to use *[name()='svg'] as described in https://www.inflectra.com/Support/KnowledgeBase/KB503.aspx
-    # And most useful XPath documentation is at https://www.w3schools.com/xml/xpath_syntax.asp
-    # switch to selected iframe document so can see if its sub-elements are ready
-    parent_of_svg_logo_element = _browser.find_element(By.XPATH, "//article/div//a/*[name()='svg']/..")
-    if parent_of_svg_logo_element:
-        # Replace the HTML of the <a> element with an image of dead twitter bird instead of the ugly X logo.
-        # Note: must use https since that is used for the rest of the page
+    # Need to just look within the iframe. Switch back to the main frame afterwards, even if
+    # there is an exception, so that subsequent software not confused.
+    browser.switch_to.frame(iframe)
+    try:
+        # Find the X logo if it is a twitter post. Then can replace it. There are several svg
+        # icons, but by using querySelector() get the first one, which is the one desired. A CSS
+        # selector with :has() is used since it is much faster than XPath. Older browsers don't
+        # support :has() though, so for them fall back to XPath. Note that with XPath there is a
+        # bug where can't just find a svg element using "svg". Instead, need to use
+        # *[name()='svg'] as described in https://www.inflectra.com/Support/KnowledgeBase/KB503.aspx
+        # The logo might legitimately not be there, so find_elements() is used for the fallback
+        # since it returns an empty list instead of raising an exception.
+        try:
+            parent_of_svg_logo_element = browser.execute_script(_SVG_LOGO_PARENT_JS)
+        except JavascriptException:
+            elements = browser.find_elements(By.XPATH, _SVG_LOGO_PARENT_XPATH)
+            parent_of_svg_logo_element = elements[0] if elements else None
+        if parent_of_svg_logo_element is None:
+            logger.info(f'X logo not found so not replacing it')
+            return
+
+        # Replace the contents of the <a> element with an image of dead twitter bird instead of the
+        # ugly X logo. The image is a data URI so no network request is needed to load it. Replacing
+        # the logo and waiting for the image to be "complete" is done with a single script.
         logger.info(f'Found X logo (most likely) so will try to replace it with something better...')
-        image_html = ('<image src="https://robotaxi.news/wp-content/uploads/2025/01/dead_twitter.png" '
-                      'name="replacement_logo" width="41" height="38">')
-        _browser.execute_script(f"arguments[0].innerHTML = '{image_html}'", parent_of_svg_logo_element)
-        logger.info(f'Updated logo html')
-
-        # Wait for the image to be loaded
-        # Find an element in the iframe that will be displayed once iframe fully loaded.
-        # Since the elements in the frame might not have been loaded yet need to
-        # give it a few seconds.
-        _browser.implicitly_wait(5)
-        image_element = _browser.find_element(By.NAME, 'replacement_logo')
-        if image_element:
-            logger.info(f'Found the name=replacement_logo image element so will make sure it is displayed...')
-            # Found that got timeout with X for 10 secs so increased to 15 secs
-            wait = WebDriverWait(_browser, timeout=15)
-            wait.until(lambda d: image_element.is_displayed())
-            logger.info(f'Image element now displayed')
-
-            # But really want to make sure that the image has actually been loaded, which is_displayed()
-            # does not indicate. Therefore execute javascript to determine if the html image element is "complete"
-            while True:
-                complete = _browser.execute_script("return arguments[0].complete", image_element)
-                if complete:
-                    break
-            logger.info(f'Image element now "complete", which means it has been fully loaded')
-
-    # Switch back to the main frame so that subsequent software not confused
-    _browser.switch_to.default_content()
-
-
-def _get_post_text(post_type: PostType) -> str:
-    match post_type:
-        case PostType.XITTER:
-            return get_twitter_post_text(_browser)
-        case PostType.BLUESKY:
-            return get_bluesky_post_text(_browser)
-        case PostType.THREADS:
-            return get_threads_post_text(_browser)
-        case _:
-            return ''
+        try:
+            loaded = browser.execute_async_script(_REPLACE_WITH_IMAGE_JS,
+                                                  parent_of_svg_logo_element,
+                                                  _LOGO_DATA_URI)
+            logger.info(f'Updated logo html and the image has been loaded. loaded={loaded}')
+        except TimeoutException:
+            logger.error(f'Timed out waiting for the replacement logo image to load')
+    finally:
+        browser.switch_to.default_content()
 
 
-def _get_likes_str(post_type: PostType) -> str:
+def _get_post_info(browser: WebDriver,
+                   post_type: PostType,
+                   iframe: WebElement | None) -> tuple[str, str, tuple[int, int, int, int]]:
     """
-    Examines the HTML and returns string to be displayed showing number of likes.
-    :param post_type:
-    :return: string that can be displayed indicating number of likes
+    Examines the HTML and returns the string to be displayed showing number of likes, the text
+    of the post, and the rectangle of the important part of the post. Want to use the least amount
+    of height possible since BlueSky uses fixed aspect ratio for Open Graph cards and if the post is
+    too tall then the image is shrunk down too much. The units of the rectangle are browser pixels.
+    :param browser: the browser that has the post loaded
+    :param post_type: so different post types can be handled differently
+    :param iframe: the iframe that contains the post, or None if there isn't one
+    :return: likes_str, post_text, and left, top, right, bottom of the important part of the page
     """
     match post_type:
         case PostType.XITTER:
-            return get_twitter_likes_str(_browser)
+            return get_twitter_post_info(browser, iframe, _get_iframe_rect(browser, iframe))
         case PostType.BLUESKY:
-            return get_bluesky_likes_str(_browser)
+            return get_bluesky_post_info(browser, iframe, _get_iframe_rect(browser, iframe))
         case PostType.THREADS:
-            return get_threads_likes_str(_browser)
+            return get_threads_post_info(browser)
         case _:
-            return ''
+            return '', '', (0, 0, 0, 0)
 
 
-def get_screenshot_for_html(url: str, post_type: PostType) -> tuple[Image, float, str, str | None]:
+def get_screenshot_for_html(html: str, post_type: PostType) -> tuple[Image, float, str, str | None]:
     """
-    Loads specified URL into the browser, takes a screenshot of it as a PNG,
+    Loads specified html into the browser, takes a screenshot of it,
     and then returns a cropped version of the screenshot.
     The shrinkage is also returned so the caller can know how tiny the resulting text is and
     whether one want to include the post's text as part of the description in the Open Graph card.
-    :param url: url of the file containing the html that describes the post. Can be on localhost.
+    :param html: the html that describes the post
     :param post_type: whether XITTER, BLUESKY, or THREADS
     :return: properly_sized_image, shrinkage, likes_str, post_text
     """
-    logger.info(f'Loading headless browser using html in url={url}')
-
-    # Load specified URL into the browser
-    _load_url(url)
+    logger.info(f'Loading headless browser using html for post')
 
-    # Wait till html fully loaded, include javascript and iframes
-    _wait_till_fully_loaded()
+    # Get a browser for just this request. It is returned to the pool when done
+    with browser_pool.checkout() as browser:
+        # Load specified html into the browser
+        _load_html(browser, html)
 
-    # Determine how many likes there are
-    likes_str = _get_likes_str(post_type)
+        # Wait till html fully loaded, include javascript and iframes. The iframe that contains
+        # the post is found just once here and then handed to the following steps.
+        iframe = _wait_till_fully_loaded(browser)
 
-    # Determine post text in case want to display it via OpenGraph description
-    post_text = _get_post_text(post_type)
+        # If want to make any modifications to the html, do so now
+        _make_modifications(browser, post_type, iframe)
 
-    # If want to make any modifications to the html, do so now
-    _make_modifications(post_type)
+        # Determine how many likes there are, the post text in case want to display it via
+        # OpenGraph description, and the key part of the page, all at once
+        likes_str, post_text, rect = _determine_key_part_of_screenshot(browser, post_type, iframe)
 
-    # Take a screenshot of the url content
-    screenshot = _get_screenshot()
+        # Take a screenshot of just the key part of the url content, which removes the
+        # surrounding white space without needing to crop afterwards
+        screenshot = _get_screenshot(browser, rect)
 
-    # Crop it to remove surrounding white space
-    rect = _determine_key_part_of_screenshot(screenshot, post_type)
-    cropped_screenshot = screenshot.crop(rect)
+    # For debugging can save the image. Not done normally since encoding PNGs is expensive.
+    # Using fast compression since these files are only for looking at.
+    if config_values.debug_save_images:
+        screenshot.save('images/debug_cropped_image.png', compress_level=1)
 
-    # FIXME For debugging save the images
-    screenshot.save('images/debug_orig_image.png')
-    cropped_screenshot.save('images/debug_cropped_image.png')
-
-    properly_sized_image = _get_properly_sized_image(cropped_screenshot)
+    properly_sized_image = _get_properly_sized_image(screenshot)
     return (properly_sized_image,
-            properly_sized_image.height / cropped_screenshot.height,
+            properly_sized_image.height / screenshot.height,
             likes_str,
             post_text)
 
 
+# Color of the semi-transparent background that the post image is centered on
+_BACKGROUND_COLOR = (31, 31, 31, 230)
+
+# Background for the largest, and most common, card size. Created just once and then copied,
+# which is cheaper than filling a new image each time.
+_MAX_BACKGROUND = Image.new(mode="RGBA", size=(1200, 630), color=_BACKGROUND_COLOR)
+
+
 def _get_properly_sized_image(img: Image) -> Image:
     """
     When the important part of the screenshot of the post is generated, it won't have the ideal
@@ -218,21 +222,31 @@ def _get_properly_sized_image(img: Image) -> Image:
         desired_h = 630
         logging.info(f'Since desired_w was greater than 1200 setting desired_w={desired_w} desired_h={desired_h}')
 
+    # The screenshot is fully opaque so drop any alpha channel. This way the resampling
+    # below only needs to process three bands instead of four.
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
     # If image too large then shrink it down to max of width 1200 and height of 630
     if img_w > desired_w or img_h > desired_h:
         shrinkage = min(desired_w / img_w, desired_h / img_h)
-        shrunken_size = round(shrinkage * img_w), round(shrinkage * img_h)
-        img.thumbnail(shrunken_size, Image.Resampling.LANCZOS)
-        img_w, img_h = img.size
+        img_w, img_h = round(shrinkage * img_w), round(shrinkage * img_h)
+        # Resize to exactly the shrunken size. The reducing_gap first reduces the image by an
+        # integer factor, which is much faster, and then only the remainder uses LANCZOS.
+        img = img.resize((img_w, img_h), Image.Resampling.LANCZOS, reducing_gap=2.0)
         logging.info(f'Shrunk image so it is now img_w={img_w} img_h={img_h}')
 
     # Create background semi-transparent image that is desired size and the right color.
     # Using values of 31 and transparency of 230 so that in Bluesky the background will
     # simply blend in with the post. Originally thought wanted a low transparency but it
     # turns out thee Bluesky background color is darker than want.
-    img_of_proper_size = Image.new(mode="RGBA",
-                                   size=(desired_w, desired_h),
-                                   color=(31, 31, 31, 230))
+    # For the common maximum size the pre-filled background is simply copied.
+    if (desired_w, desired_h) == _MAX_BACKGROUND.size:
+        img_of_proper_size = _MAX_BACKGROUND.copy()
+    else:
+        img_of_proper_size = Image.new(mode="RGBA",
+                                       size=(desired_w, desired_h),
+                                       color=_BACKGROUND_COLOR)
 
     # Write the shrunken image onto center of the transparent background
     centering_offset = ((desired_w - img_w) // 2, (desired_h - img_h) // 2)
@@ -242,128 +256,185 @@ def _get_properly_sized_image(img: Image) -> Image:
     return img_of_proper_size
 
 
-def _load_url(url) -> None:
+def _load_html(browser: WebDriver, html: str) -> None:
     """
-    Fetches the URL using the browser and waits till the post
-    (but not any iframe) is fully loaded
-    :param url:
+    Loads the html using the browser and waits till the post (but not any iframe) is fully
+    loaded. The html is passed in as a data URL so that it doesn't need to be written to a file.
+    :param browser: the browser to use
+    :param html: the html that describes the post
     :return:
     """
-    _browser_init()
-    _browser.get(url)
+    browser.get('data:text/html;base64,' + base64.b64encode(html.encode('utf-8')).decode('ascii'))
 
 
-def _get_screenshot() -> Image:
+def _get_screenshot(browser: WebDriver, rect: tuple[int, int, int, int] | None) -> Image:
     """
-    Takes screenshot of visible part of the browser window and returns it as a Pillow Image
-    :return:
+    Takes screenshot of visible part of the browser window and returns it as a Pillow Image.
+    Uses the Chrome DevTools Protocol directly so that the image data is only base64 decoded once
+    and is handed straight to Pillow. A JPEG using Chrome's optimize for speed mode is requested
+    since it is much faster to encode than a PNG, and the image is resized afterwards anyway.
+    If a rect is specified then only that part of the window is captured, which means that only
+    the needed part has to be encoded.
+    :param browser: the browser to take the screenshot of
+    :param rect: left, top, right, bottom of the part of the window to capture, in browser
+    pixels. If None, or if the rect is empty, the whole visible window is captured.
+    :return: the screenshot
     """
     logger.info(f'Taking screenshot...')
-    png = _browser.get_screenshot_as_png()
-    return Image.open(BytesIO(png))
+    params = {'format': 'jpeg', 'quality': 92, 'optimizeForSpeed': True, 'captureBeyondViewport': False}
+    if rect:
+        left, top, right, bottom = rect
+        if right > left and bottom > top:
+            params['clip'] = {'x': left, 'y': top, 'width': right - left, 'height': bottom - top, 'scale': 1}
+        else:
+            logger.error(f'Rect {rect} for screenshot is empty so capturing the whole window')
 
-
-def _get_image_pixels_per_browser_pixel(image: Image):
+    try:
+        result = browser.execute_cdp_cmd('Page.captureScreenshot', params)
+    except WebDriverException as e:
+        # Older versions of Chrome might not handle the JPEG options so fall back to a plain PNG
+        logger.error(f'Could not take JPEG screenshot so taking a PNG one instead. {e}')
+        for param in ('quality', 'optimizeForSpeed'):
+            del params[param]
+        params['format'] = 'png'
+        result = browser.execute_cdp_cmd('Page.captureScreenshot', params)
+
+    return Image.open(BytesIO(base64.b64decode(result['data'])))
+
+
+# Script for execute_async_script() that calls back once the document has loaded and its first
+# div is displayed. Uses the load event and then a MutationObserver in case the div is created
+# or made visible later by javascript. The callback is done on the next animation frame so
+# that the div has actually been rendered.
+_WAIT_FOR_DISPLAYED_DIV_JS = """
+    const callback = arguments[arguments.length - 1];
+    const divDisplayed = () => {
+        const div = document.querySelector('div');
+        if (!div || div.getClientRects().length === 0) return false;
+        requestAnimationFrame(() => callback(true));
+        return true;
+    };
+    const waitForDiv = () => {
+        if (divDisplayed()) return;
+        const observer = new MutationObserver(() => {
+            if (divDisplayed()) observer.disconnect();
+        });
+        observer.observe(document, {childList: true, subtree: true, attributes: true});
+    };
+    if (document.readyState === 'complete') waitForDiv();
+    else window.addEventListener('load', waitForDiv, {once: true});
+"""
+
+
+# Script that returns true if all the images in the document have been loaded. Lazy loaded
+# images might not be loaded at all if they are not within the window, which would result in
+# blank images in the screenshot. Therefore they are first switched to load eagerly.
+_ALL_IMAGES_COMPLETE_JS = """
+    document.querySelectorAll('img[loading="lazy"]').forEach(image => {
+        image.loading = 'eager';
+        image.fetchPriority = 'high';
+    });
+    return Array.from(document.images).every(image => image.complete);
+"""
+
+
+# Returns the rect of the iframe passed in as the argument. Like the WebElement rect, the
+# position is relative to the document.
+_IFRAME_RECT_JS = """
+    const rect = arguments[0].getBoundingClientRect();
+    return {x: rect.left + window.scrollX, y: rect.top + window.scrollY,
+            width: rect.width, height: rect.height};
+"""
+
+
+def _get_iframe_rect(browser: WebDriver, iframe: WebElement | None) -> dict:
     """
-    Pixels in browser are not the same as pixels for the screen or for a
-    screenshot. Depends on display resolution. To determine the ratio
-    need to compare width of image to current width of browser window.
-    Need to look at width since can get width of content using
-    get_window_size(), whereas that function includes browser toolbar
-    when looking at height. Also, need to use get_window_size() to get
-    the width since it might be different than the requested width
-    since the browser likely has a minimum width (e.g. 500px for Chrome,
-    usually)
-    :param image: Image
+    Gets the position and size of the iframe that contains the post, relative to the document.
+    Done with a script since it is a single call to the browser and reading the rect of a
+    WebElement needs more.
+    :param browser: the browser that has the post loaded
+    :param iframe: the iframe as found when waiting for the post to load
+    :return: dict with x, y, width, and height of the iframe
     """
-    window_size = _browser.get_window_size()
-    return image.size[0] / window_size['width']
+    if iframe is None:
+        raise NoSuchElementException('No iframe found for post')
+    return browser.execute_script(_IFRAME_RECT_JS, iframe)
 
 
-def _wait_till_fully_loaded() -> None:
+def _wait_till_fully_loaded(browser: WebDriver) -> WebElement | None:
     """
     Waits till the post html has been fully loaded.
     First need to determine if the post uses an iframe. If it doesn't then the get()
     will have made sure that the post is fully loaded, so all done. But if an iframe
     exists then need to make sure that it has been loaded.
-    :return:None
+    :return: the iframe that contains the post, so that it doesn't need to be looked up again,
+    or None if the post doesn't use an iframe
     """
     logger.info(f'Waiting till html fully loaded and rendered...')
 
     try:
-        # Have find_element() return after just 1 second when looking for iframe.
-        # Sometimes TTwitter posts might take a bit to convert to iframe. Therefore
-        # need to give some time. But don't want to wait too long because some
-        # non-Twitter posts might not use an iframe at all and don't want to wait
-        # too long for these.
-        _browser.implicitly_wait(1)
-
-        # See if iframe is being used. If not then NoSuchElementException will occur
-        iframe = _browser.find_element(By.TAG_NAME, "iframe")
+        # Wait at most 1 second for the iframe. Sometimes Twitter posts might take a bit to
+        # convert to iframe. Therefore need to give some time. But don't want to wait too long
+        # because some non-Twitter posts might not use an iframe at all. An explicit wait is
+        # used instead of an implicit one so that other element lookups are not slowed down.
+        # If the iframe is not found then TimeoutException will occur.
+        iframe = WebDriverWait(browser, 1).until(EC.presence_of_element_located((By.TAG_NAME, "iframe")))
         logger.info(f'An iframe html element found')
 
         # switch to selected iframe document so can see if its sub-elements are ready
-        _browser.switch_to.frame(iframe)
+        browser.switch_to.frame(iframe)
 
-        # Find an element in the iframe that will be displayed once iframe fully loaded.
-        # Since the elements in the frame might not have been loaded yet need to
-        # give it a few seconds.
-        _browser.implicitly_wait(5)
-        element = _browser.find_element(By.TAG_NAME, 'div')
-        logger.info(f'Found a div html element within the iframe. DOM id= {element.get_dom_attribute("id")}')
-
-        # Wait until the element has actually been displayed
-        wait = WebDriverWait(_browser, timeout=10)
-        wait.until(lambda d: element.is_displayed())
-        logger.info(f'A div element within the iframe is now displayed')
+        # Wait until the first div in the iframe, which will be displayed once the iframe is fully
+        # loaded, has actually been displayed. Done with a single script that is notified by the
+        # load event and DOM changes instead of repeatedly polling whether the element is displayed.
+        try:
+            browser.execute_async_script(_WAIT_FOR_DISPLAYED_DIV_JS)
+            logger.info(f'A div element within the iframe is now displayed')
+        except TimeoutException:
+            logger.error(f'Timed out waiting for a div element within the iframe to be displayed')
 
         # For some systems it turns out that it can take a while to load in images.
         # Therefore should wait for all of them to load for continuing and taking snapshot.
         logger.info('Making sure all images fully loaded and displayed...')
-        image_elements = _browser.find_elements(By.TAG_NAME, 'img')
-        start = time.time()
-        for image in image_elements:
-            # Wait till image has actually been loaded, which by executing
-            # javascript to determine if the html image element is "complete".
-            # But only wait at most 6 seconds.
-            while time.time() - start < 6.0:
-                complete = _browser.execute_script("return arguments[0].complete", image)
-                if complete:
-                    break
-                # Sleep a bit before trying again so don't use up all CPU
-                time.sleep(0.1)
-            logger.info(f'Another one of the images now completely loaded')
-
-        logger.info('The post is now fully loaded, images and all')
-    except NoSuchElementException as e:
+        try:
+            # Wait till all the images have actually been loaded, by executing javascript that
+            # determines if every html image element is "complete". All the images are checked
+            # with a single script each poll, and document.images is used so that the image
+            # elements don't first need to be found. But only wait at most 6 seconds.
+            WebDriverWait(browser, 6, poll_frequency=0.2).until(
+                lambda d: d.execute_script(_ALL_IMAGES_COMPLETE_JS))
+            logger.info('The post is now fully loaded, images and all')
+        except TimeoutException:
+            logger.error(f'Timed out waiting for all the images of the post to load')
+
+        return iframe
+    except TimeoutException:
         # There was no iframe as part of the post rendering so can't wait
-        logger.error("No iframe used so page so cannot wait until loaded", e)
-        return
+        logger.error("No iframe used so page so cannot wait until loaded")
+        return None
     finally:
         # Switch back to the main frame so that subsequent software not confused
-        _browser.switch_to.default_content()
+        browser.switch_to.default_content()
 
 
-def _determine_key_part_of_screenshot(screenshot: Image, post_type: PostType) -> tuple[int, int, int, int]:
+def _determine_key_part_of_screenshot(browser: WebDriver,
+                                      post_type: PostType,
+                                      iframe: WebElement | None) -> tuple[str, str, tuple[int, int, int, int] | None]:
     """
-    Gets the rectangle of the important part of the post. Want to use the least amount of height
-    possible since BlueSky uses fixed aspect ratio for Open Graph cards and if the post is too
-    tall then the image is shrunk down too much. The units are in screen pixels
-    :param screenshot: an Image to be trimmed
+    Gets the rectangle of the important part of the post, along with the likes string and the
+    post text since those are read from the post at the same time. Want to use the least amount
+    of height possible since BlueSky uses fixed aspect ratio for Open Graph cards and if the post
+    is too tall then the image is shrunk down too much. The units are in browser pixels so that
+    the rectangle can be used directly as the clip for the screenshot.
+    :param browser: the browser that has the post loaded
     :param post_type: so different post types can be handled differently
-    :return:left, top, right, bottom, the coordinates of the important part of the image that should be kept
+    :param iframe: the iframe that contains the post, or None if there isn't one
+    :return: likes_str, post_text, and left, top, right, bottom, the coordinates of the important
+    part of the page that should be captured. The rectangle is None if the whole window is to be used.
     """
-    logger.info(f'Getting rectangle of important part of <article> tag...')
+    if post_type == PostType.UNKNOWN:
+        return '', '', None
 
-    ratio = _get_image_pixels_per_browser_pixel(screenshot)
-    logger.info(f'Pixel ratio={ratio}')
+    logger.info(f'Getting rectangle of important part of <article> tag...')
 
-    match post_type:
-        case PostType.XITTER:
-            return get_twitter_rect(ratio, _browser)
-        case PostType.BLUESKY:
-            return get_bluesky_rect(ratio, _browser)
-        case PostType.THREADS:
-            return get_threads_rect(ratio, _browser)
-        case _:
-            return 0, 0, screenshot.width, screenshot.height
+    return _get_post_info(browser, post_type, iframe)
@@ -0,0 +1,181 @@
+# Pool of headless Chrome browsers used for rendering posts
+import contextlib
+import logging
+import queue
+import threading
+from typing import Iterator
+
+from selenium import webdriver
+from selenium.common import WebDriverException
+from selenium.webdriver.chrome.webdriver import WebDriver
+
+from main import config_values
+
+logger = logging.getLogger()
+
+# URL patterns for resources that browser doesn't need to load for rendering a post
+_BLOCKED_URLS = [
+    '*google-analytics.com*',
+    '*googletagmanager.com*',
+    '*doubleclick.net*',
+    '*platform.twitter.com/jot.html*',
+    '*syndication.twitter.com/i/jot*',
+]
+
+# Idle browsers that are ready to be checked out
+_idle: queue.Queue[WebDriver] = queue.Queue()
+
+# Limits how many browsers can be checked out at once, and therefore how many exist. If all
+# browsers are in use then a checkout blocks until one is returned.
+_available = threading.Semaphore(config_values.browser_pool_size)
+
+# How many times each browser has been used. Only changed by the thread that has the browser
+# checked out so no lock is needed.
+_use_counts: dict[WebDriver, int] = {}
+
+
+def prefill() -> None:
+    """
+    Starts up all the browsers of the pool so that the first requests don't have to wait for
+    Chrome to start. Should be called once at startup before any browser is checked out.
+    """
+    logger.info(f'Starting {config_values.browser_pool_size} headless browsers for the pool...')
+    for _ in range(config_values.browser_pool_size):
+        _idle.put(_create_browser())
+
+
+@contextlib.contextmanager
+def checkout() -> Iterator[WebDriver]:
+    """
+    Context manager that provides a browser that only the caller uses until the with block
+    is exited. Blocks if all the browsers are currently in use. If there is no idle browser,
+    for example because prefill() wasn't called, then a new one is created.
+    :return: the browser to use
+    """
+    _available.acquire()
+    try:
+        try:
+            browser = _idle.get_nowait()
+        except queue.Empty:
+            browser = _create_browser()
+    except:
+        _available.release()
+        raise
+
+    try:
+        yield browser
+    finally:
+        _return(browser)
+
+
+def _return(browser: WebDriver) -> None:
+    """
+    Returns the browser to the pool once it has been used. The browser is navigated to a blank
+    page so that the scripts of the previous post don't keep running and so that its cookies
+    are cleared. If the browser has been used too many times then it is replaced with a new
+    one to bound memory growth in Chrome. A browser that no longer responds is also replaced.
+    :param browser: browser obtained via checkout()
+    """
+    uses = _use_counts.get(browser, 0) + 1
+    _use_counts[browser] = uses
+
+    if uses < config_values.browser_max_uses:
+        try:
+            browser.execute_cdp_cmd('Network.clearBrowserCookies', {})
+            browser.get('about:blank')
+            _idle.put(browser)
+            _available.release()
+            return
+        except WebDriverException as e:
+            logger.error(f'Browser no longer working so replacing it. {e}')
+    else:
+        logger.info(f'Browser has been used {uses} times so replacing it')
+
+    # Replace the browser in the background so that the current request doesn't have to wait
+    # for Chrome to start
+    threading.Thread(target=_replace, args=(browser,), daemon=True).start()
+
+
+def _replace(browser: WebDriver) -> None:
+    """
+    Quits the browser and puts a newly created one into the pool in its place. The pool slot
+    is only released after the new browser is idle so that the number of browsers stays limited.
+    :param browser: the browser to quit
+    """
+    _use_counts.pop(browser, None)
+    try:
+        browser.quit()
+    except WebDriverException as e:
+        logger.error(f'Exception when quitting browser. {e}')
+
+    try:
+        _idle.put(_create_browser())
+    except Exception as e:
+        # Another browser will be created when it is next needed
+        logger.error(f'Could not create replacement browser. {e}')
+    finally:
+        _available.release()
+
+
+def _create_browser() -> WebDriver:
+    """
+    Creates and initializes a new browser
+    :return: the new browser
+    """
+    # Options listed at https://www.selenium.dev/documentation/webdriver/drivers/options/
+    options = webdriver.ChromeOptions()
+    # to get rid of warning message at top of page
+    options.add_experimental_option("excludeSwitches", ['enable-automation']);
+    # If chrome_headless_shell specified then use it. It is always headless and starts faster
+    # and uses less memory than full Chrome. Otherwise run full Chrome without actually
+    # displaying browser window.
+    if config_values.chrome_headless_shell:
+        options.binary_location = config_values.chrome_headless_shell
+    else:
+        options.add_argument('--headless=new')
+        # If chrome_web_browser specified then use it. Otherwise uses selenium default value
+        if config_values.chrome_web_browser:
+            options.binary_location = config_values.chrome_web_browser
+    # Since several browsers in the pool render at the same time make sure that Chrome doesn't
+    # throttle timers or rendering of a browser it considers to be in the background
+    options.add_argument('--disable-renderer-backgrounding')
+    options.add_argument('--disable-backgrounding-occluded-windows')
+    options.add_argument('--disable-background-timer-throttling')
+    # Extensions aren't needed. And /dev/shm is small on a Raspberry Pi so use /tmp instead
+    options.add_argument('--disable-extensions')
+    options.add_argument('--disable-dev-shm-usage')
+    # Don't do first run setup or background requests such as for updates since only rendering posts
+    options.add_argument('--no-first-run')
+    options.add_argument('--disable-background-networking')
+    options.add_argument('--disable-gpu')
+    options.add_argument('--disable-sync')
+    options.add_argument('--disable-default-apps')
+    options.add_argument('--no-default-browser-check')
+    options.add_argument('--disable-breakpad')
+    options.add_argument('--metrics-recording-only')
+    # Posts are static images so don't play any video or audio, and ask sites not to animate
+    options.add_argument('--mute-audio')
+    options.add_argument('--autoplay-policy=user-gesture-required')
+    options.add_argument('--force-prefers-reduced-motion')
+
+    # If chrome_webdriver specified then use it. Otherwise uses selenium default value
+    if config_values.chrome_webdriver:
+        service = webdriver.ChromeService(executable_path=config_values.chrome_webdriver)
+    else:
+        service = None
+
+    browser = webdriver.Chrome(options=options, service=service)
+
+    # Note: Chrome only goes down to 400px or 500px width. To get skinnier post need to put the
+    # post html within a <div style="max-width: 399px"> </div> block.
+    browser.set_window_size(600, 1000)
+
+    # Limit how long execute_async_script() can wait, such as for an image to load
+    browser.set_script_timeout(15)
+
+    # Don't load analytics and ad trackers since they aren't needed for the image but still
+    # take time to load. Images and fonts are still loaded since they are part of the post.
+    browser.execute_cdp_cmd('Network.enable', {})
+    browser.execute_cdp_cmd('Network.setBlockedURLs', {'urls': _BLOCKED_URLS})
+
+    return browser
@@ -1,36 +1,55 @@
 # Handles configuration parameters
 
 import configparser
-
-
-def init_config():
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """
+    The configuration parameters, already converted to the proper types. Frozen since the
+    values are only read in once at startup.
+    """
+    http_port: int
+    https_port: int
+    certfile: str
+    keyfile: str
+    domain: str
+    chrome_web_browser: str | None
+    chrome_webdriver: str | None
+    chrome_headless_shell: str | None
+    browser_pool_size: int
+    browser_max_uses: int
+    worker_processes: int
+    http_threads: int
+    allowable_cache_file_age_hours: int
+    readme_url: str
+    debug_save_images: bool
+
+
+def init_config() -> Config:
     config = configparser.ConfigParser()
     config.read('config.ini')
 
-    http_port = config.getint('HTTP', 'http_port', fallback=9080)
-    https_port = config.getint('HTTP', 'https_port', fallback=9443)
-    certfile = config.get('HTTP', 'certfile', fallback='certfile.pem')
-    keyfile = config.get('HTTP', 'keyfile', fallback='keyfile.pem')
-    domain = config.get('HTTP', 'domain', fallback='xrosspost.com')
-
-    chrome_web_browser = config.get('misc', 'chrome_web_browser', fallback=None)
-    chrome_webdriver = config.get('misc', 'chrome_webdriver', fallback=None)
-
-    readme_url = config.get('misc', 'readme_url')
-
-    allowable_cache_file_age_hours = config.get('misc', 'allowable_cache_file_age_hours', fallback=24)
-
-    # Return a dictionary with the retrieved values
-    config_values = {
-        'http_port': http_port,
-        'https_port': https_port,
-        'certfile': certfile,
-        'keyfile': keyfile,
-        'domain': domain,
-        'chrome_web_browser': chrome_web_browser,
-        'chrome_webdriver': chrome_webdriver,
-        'allowable_cache_file_age_hours': allowable_cache_file_age_hours,
-        'readme_url': readme_url
-    }
-
-    return config_values
+    # Return the retrieved values
+    return Config(
+        http_port=config.getint('HTTP', 'http_port', fallback=9080),
+        https_port=config.getint('HTTP', 'https_port', fallback=9443),
+        certfile=config.get('HTTP', 'certfile', fallback='certfile.pem'),
+        keyfile=config.get('HTTP', 'keyfile', fallback='keyfile.pem'),
+        domain=config.get('HTTP', 'domain', fallback='xrosspost.com'),
+
+        chrome_web_browser=config.get('misc', 'chrome_web_browser', fallback=None),
+        chrome_webdriver=config.get('misc', 'chrome_webdriver', fallback=None),
+        chrome_headless_shell=config.get('misc', 'chrome_headless_shell', fallback=None),
+        browser_pool_size=config.getint('misc', 'browser_pool_size', fallback=1),
+        browser_max_uses=config.getint('misc', 'browser_max_uses', fallback=50),
+        worker_processes=config.getint('HTTP', 'worker_processes', fallback=1),
+        http_threads=config.getint('HTTP', 'http_threads', fallback=256),
+
+        readme_url=config.get('misc', 'readme_url'),
+
+        debug_save_images=config.getboolean('misc', 'debug_save_images', fallback=False),
+
+        allowable_cache_file_age_hours=config.getint('misc', 'allowable_cache_file_age_hours', fallback=24),
+    )
@@ -0,0 +1,57 @@
+# For creating the HTTP sessions used to get the html of posts
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Timeouts for connecting and for reading the response, in seconds. So that a hung server
+# doesn't hold up a request thread forever.
+TIMEOUT = (3, 10)
+
+logger = logging.getLogger()
+
+# The sessions that have been created, along with a URL on the host that each is used for
+_sessions: list[tuple[requests.Session, str]] = []
+
+
+def create_session(warm_up_url: str) -> requests.Session:
+    """
+    Creates a session for requests to one of the social media sites. Reusing the session means
+    that the TCP+TLS connections are kept alive and pooled instead of being set up for every
+    post. Retries with exponential backoff handle rate limiting and temporary server errors.
+    A Retry-After header from the server is not obeyed since it can ask for a wait of many
+    minutes, which would hold up the request thread far longer than the timeouts allow.
+    :param warm_up_url: URL on the host that the session is used for. Requested by warm_up()
+    so that a connection is already open when the first post is requested.
+    :return: the new session
+    """
+    session = requests.Session()
+    session.headers.update({'User-Agent': 'post2image (+https://github.com/skibu/post2image)'})
+    session.mount('https://', HTTPAdapter(pool_connections=4,
+                                          pool_maxsize=16,
+                                          max_retries=Retry(total=3,
+                                                            backoff_factor=0.5,
+                                                            respect_retry_after_header=False,
+                                                            status_forcelist=(429, 500, 502, 503, 504))))
+    _sessions.append((session, warm_up_url))
+    return session
+
+
+def warm_up() -> None:
+    """
+    Opens a connection for each of the sessions in the background, so that the DNS lookup and
+    the TCP+TLS handshake are not done while handling the first request for a post. Should be
+    called after any forking of worker processes since connections can't be shared between
+    processes.
+    """
+    def warm_up_sessions():
+        for session, url in _sessions:
+            try:
+                session.head(url, timeout=TIMEOUT)
+            except requests.RequestException as e:
+                # Not a problem since the connection will be opened when it is needed
+                logger.warning(f'Could not warm up connection for {url}. {e}')
+
+    threading.Thread(target=warm_up_sessions, daemon=True).start()
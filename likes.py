@@ -0,0 +1,24 @@
+# For creating the likes string shown for twitter and bluesky posts
+import logging
+from html import escape
+
+logger = logging.getLogger()
+
+# Likes string is only valid if it starts with one of these
+_NON_ZERO_DIGITS = frozenset('123456789')
+
+
+def get_likes_str(likes_number: str) -> str:
+    """
+    Makes sure the likes number wasn't actually a match to one of the other elements, one that
+    doesn't start with a number. And makes sure not blank or zero.
+    :param likes_number: the likes text found in the post
+    :return: the escaped likes number with a heart, or empty string if likes_number not valid
+    """
+    if likes_number[:1] not in _NON_ZERO_DIGITS:
+        return ''
+
+    # The likes text comes from the page so it is escaped before being put into the card
+    likes_str = f'{escape(likes_number)} &#9825;'  # &#9825; is heart outline
+    logger.info(f'Found the likes string={likes_str}')
+    return likes_str
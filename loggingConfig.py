@@ -1,11 +1,21 @@
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
 
 logging_dir = './logs/'
 log_format = ('%(asctime)s.%(msecs)03d-%(levelname)s-%(thread)d-' 
               '%(filename)s:%(lineno)d: %(message)s')
 date_format = '%m/%d/%y %H:%M:%S'
 
+# The listeners that write the queued log records to the files, one per logger
+_listeners: list[logging.handlers.QueueListener] = []
+
+# For each logger the file handler and the queue handler that feeds it, so that new queues
+# can be set up in a forked child process
+_queued_loggers: list[tuple[logging.Logger, logging.Handler, logging.handlers.QueueHandler]] = []
+
 
 def setup_logger(name, log_file, level=logging.INFO):
     """To setup as many loggers as you want"""
@@ -19,11 +29,52 @@ def setup_logger(name, log_file, level=logging.INFO):
     # Actually create the logger
     the_logger = logging.getLogger(name)
     the_logger.setLevel(level)
-    the_logger.addHandler(handler)
+    _add_queue(the_logger, handler)
 
     return the_logger
 
 
+def _add_queue(the_logger: logging.Logger, handler: logging.Handler) -> None:
+    """
+    The logger just puts the records onto a queue and a separate thread writes them to the
+    file. This way the threads handling requests don't have to wait for the file writes.
+    :param the_logger: the logger to add the queue to
+    :param handler: the file handler that the listener thread writes the records with
+    """
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    _listeners.append(listener)
+
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    the_logger.addHandler(queue_handler)
+    _queued_loggers.append((the_logger, handler, queue_handler))
+
+
+def _stop_listeners():
+    """Writes out any remaining queued log records when exiting"""
+    for listener in _listeners:
+        listener.stop()
+
+
+def _new_queues_in_child():
+    """
+    The listener threads don't exist in a forked child process. And records that were still
+    in the inherited queues are written by the parent, so they must not be written again by
+    the child. Therefore the child gets its own queues, queue handlers, and listeners.
+    """
+    inherited = list(_queued_loggers)
+    _queued_loggers.clear()
+    _listeners.clear()
+    for the_logger, handler, queue_handler in inherited:
+        the_logger.removeHandler(queue_handler)
+        _add_queue(the_logger, handler)
+
+
+atexit.register(_stop_listeners)
+os.register_at_fork(after_in_child=_new_queues_in_child)
+
+
 # Create the main logger, which is the root logger since no name is given
 logger = setup_logger(None, 'post2image.log', level=logging.INFO)
 logger.info('========================================================================')
@@ -0,0 +1,61 @@
+# In-memory least recently used cache, for keeping frequently requested items in memory
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LruCache:
+    """
+    A thread safe least recently used cache. When the cache is full the least recently used
+    entries are evicted. Entries can also be given a time to live so that they are refreshed
+    once they become too old.
+    """
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None):
+        """
+        :param max_entries: maximum number of entries to keep
+        :param ttl: seconds after which an entry is too old to be used, or None if entries
+        don't expire
+        """
+        self._max_entries = max_entries
+        self._ttl = ttl
+        # Each entry is the value and the time it expires
+        self._entries: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        :param key:
+        :return: the value for the key, or None if not in the cache or if too old
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() >= entry[1]:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Stores the value for the key, evicting the least recently used entry if full
+        :param key:
+        :param value:
+        """
+        expiry_time = time.monotonic() + self._ttl if self._ttl is not None else float('inf')
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, expiry_time)
+            if len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        """
+        Removes the entry for the key, if there is one
+        :param key:
+        """
+        with self._lock:
+            self._entries.pop(key, None)
@@ -1,23 +1,28 @@
 import logging
+from html import escape
 import os
-from typing import Optional
+import threading
+from typing import Callable, Optional
 import time
 import traceback
+from concurrent.futures import Future
 from http.server import BaseHTTPRequestHandler
 from http.server import ThreadingHTTPServer
+import socket
 import ssl
 import re
-from io import BytesIO
 from urllib.parse import urlparse
-from PIL import Image
 
 from browserType import PostType
 import browser
+import browser_pool
+import httpSession
 import loggingConfig
 from bluesky import bluesky_post_regex, get_bluesky_post_html
 from main import config_values
 from threads import threads_post_regex, get_threads_post_html
 from twitter import get_twitter_post_html, twitter_post_regex
+from memoryCache import LruCache
 from stable_hash import stable_hash_str
 
 # The root logger
@@ -27,31 +32,108 @@ logger = logging.getLogger()
 logger_bad_requests = loggingConfig.setup_logger("bad_requests", 'bad_requests.log')
 logger_bad_requests.propagate = False
 
-# So can erase tmp file at startup
-_first_time = True
+# Recently used Open Graph cards, keyed by path, along with the time the card becomes too old.
+# Crawlers tend to request the same posts repeatedly so this avoids reading the cache files.
+_card_memory_cache = LruCache(max_entries=1024)
+
+# Cards that are currently being created, keyed by path. Used so that concurrent requests for
+# the same post share a single rendering.
+_cards_in_progress: dict[str, Future] = {}
+_cards_in_progress_lock = threading.Lock()
+
+# For each type of post the domain of the original post, and where the user name starts in the
+# path of the post. Looked up once the post type has been determined so that the path doesn't
+# need to be scanned again for each type of post.
+_ORIGINAL_DOMAINS = {
+    PostType.XITTER: 'x.com',
+    PostType.BLUESKY: 'bsky.app',
+    PostType.THREADS: 'threads.net',
+}
+_USER_NAME_STARTS = {
+    PostType.XITTER: len('/'),  # like "/becauseberkeley/status/1865482308008255873"
+    PostType.BLUESKY: len('/profile/'),  # like "/profile/skibu.bsky.social/post/3lcmchch6js2j"
+    PostType.THREADS: len('/@'),  # like "/@lakota_man/post/DDXTHZ2Jr14"
+}
+
+# Parts of the User-Agent header that indicate that request is from an Open Graph crawler.
+# Combined into a single case-insensitive regex so that the header is scanned just once and
+# doesn't first need to be lowercased.
+_CRAWLER_USER_AGENT_RE = re.compile(r'opengraph|bluesky cardyb', re.IGNORECASE)
+
+# Start of the URLs of the images referenced by the cards
+_IMAGE_URL_PREFIX = 'http://' + config_values.domain + '/'
+
+# The Open Graph card returned to crawlers. Only the values for the post are filled in.
+_CARD_TEMPLATE = """
+<html>
+<head>
+<!-- OpenGraph card for post {path} -->
+<meta property="og:title" content="{title}" />
+<meta name="twitter:title" content="{title}" /> 
+<meta property="og:description" content="{description}" />
+<meta property="og:image" content="{image_url}" />
+ <!-- doesn't work on Bluesky et al so not truly needed-->
+<meta property="og:type" content="image" />
+<meta property="og:image:width" content="{width}" />
+<meta property="og:image:height" content="{height}" />
+</head>
+</html>"""
 
 
 # noinspection PyMethodMayBeStatic
 class RequestHandler(BaseHTTPRequestHandler):
-    _temp_html_file_name = 'tmp/post.html'
     _images_directory = 'images'
     _cache_directory = 'cache'
 
-    def do_GET(self):
-        # If first time run then make sure there is no tmp file lying around from before.
-        # Wanted to put this into __init__ but then it was called for every request
-        global _first_time
-        if _first_time:
-            logger.info(f'First web request to process so initialing web server...')
-            self._erase_tmp_file()
-            _first_time = False
+    # Use HTTP/1.1 so that connections are kept alive. Crawlers typically request the card and
+    # then right away the image, and this way they don't need to set up another TCP and TLS
+    # connection for it. All responses therefore need a Content-Length.
+    protocol_version = 'HTTP/1.1'
+
+    # Seconds to wait on a client that stops sending or receiving, so that stalled or
+    # deliberately slow clients can't hold on to one of the limited connections forever
+    timeout = 10
+
+    # Seconds to wait for another request on a kept alive connection. Short since an idle
+    # connection still uses up one of the limited connections. A crawler that wants the image
+    # right after the card asks for it immediately.
+    _keep_alive_timeout = 2
 
+    def handle(self):
+        """
+        Handles the requests of the connection. Same as BaseHTTPRequestHandler.handle() except
+        that after the first request only waits _keep_alive_timeout for another one.
+        """
+        self.handle_one_request()
+        if not self.close_connection:
+            self.connection.settimeout(self._keep_alive_timeout)
+        while not self.close_connection:
+            self.handle_one_request()
+
+    def end_headers(self):
+        # If the server is busy then close the connection after this response so that idle
+        # kept alive connections don't make other clients wait
+        if self.server.is_busy():
+            self.send_header('Connection', 'close')
+        super().end_headers()
+
+    # Buffer what is written to the response so that the headers and the body of a response are
+    # sent to the socket with a single write when the request has been handled, instead of
+    # the headers being sent separately by end_headers().
+    wbufsize = 64 * 1024
+
+    # In case a response is still sent with multiple writes, such as the headers followed by
+    # sendfile() for an image, make sure that Nagle's algorithm doesn't hold back the second part
+    # until the first is acknowledged. So set TCP_NODELAY on each connection.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
         logger.info(f'================ Handling request for path={self.path} ================')
 
         # If no path specified then redirect to the readme page
         if self.path == '/':
-            logger.info(f"No path specified so redirecting to page {config_values['readme_url']}")
-            self._return_redirect(config_values['readme_url'])
+            logger.info(f"No path specified so redirecting to page {config_values.readme_url}")
+            self._return_redirect(config_values.readme_url)
             return
 
         # If getting image from cache, do so...
@@ -60,38 +142,69 @@ class RequestHandler(BaseHTTPRequestHandler):
             self._return_image(image_local_file_name)
             return
 
+        # Determine the path and the type of post just once. If there is a query string represented
+        # by a '?' then trim it off so that it doesn't complicate things. This is important because
+        # sometimes post URLs will include a query string with superfluous info.
+        path = urlparse(self.path).path
+        post_type = self._get_post_type(path)
+
         # If requestor is an open graph crawler then return the open graph card.
         # Otherwise return a redirect to the original post.
         if self._is_open_graph_crawler():
-            self._return_open_graph_card()
+            # If not a post, such as /favicon.ico or /robots.txt, then there is no card for
+            # it. Reply right away so that such requests don't go through card creation.
+            if post_type == PostType.UNKNOWN:
+                logger_bad_requests.warning(f'{self.client_address[0]} : Not a post that can be handled:"{self.path}"')
+                self._error_response(f'Not a post path={path}')
+                return
+
+            self._return_open_graph_card(path, post_type)
         else:
-            self._return_redirect_to_original_post()
+            self._return_redirect_to_original_post(post_type)
 
     def _return_image(self, local_file_name: str) -> None:
         """
-        Returns image at local_file_name as an http response
+        Returns image at local_file_name as an http response. The file is already a PNG so it
+        is sent as is using sendfile(), which lets the kernel copy it from the page cache directly
+        to the socket instead of reading it into Python first. Since recently used image files
+        stay in the page cache no separate in-memory cache of images is needed.
         :param local_file_name:
         """
-        # Read in image from file
-        image = Image.open(local_file_name)
-
-        # Create the image response
-        self.send_response(200)
-        self.send_header('Content-Type', 'image/png')
-
-        # Return object as a PNG (though should already be a PNG)
-        img_bytes_io = BytesIO()
-        image.save(img_bytes_io, 'PNG')
-        img_bytes_io.seek(0)
-        img_bytes = img_bytes_io.read()
-
-        # Finish up the response headers
-        content_length = len(img_bytes)
-        self.send_header('Content-Length', str(content_length))
-        self.end_headers()
+        # Only serve files that are directly within the images directory so that a path
+        # containing '..' can't be used to read other files
+        if os.path.dirname(os.path.normpath(local_file_name)) != self._images_directory:
+            return self._error_response(f'Invalid image {local_file_name}')
 
-        # Write out the body
-        self.wfile.write(img_bytes)
+        try:
+            f = open(local_file_name, 'rb')
+        except FileNotFoundError:
+            return self._error_response(f'No such image {local_file_name}')
+
+        with f:
+            stat = os.fstat(f.fileno())
+            etag = _image_etag(stat)
+
+            # If the requestor already has this version of the image then done
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+
+            # Create the image response
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(stat.st_size))
+            self.send_header('ETag', etag)
+            max_age = config_values.allowable_cache_file_age_hours * 60 * 60
+            self.send_header('Cache-Control', f'public, max-age={max_age}')
+            self.end_headers()
+
+            # Write out the body. The buffered headers need to be sent first since sendfile()
+            # writes directly to the socket. For https the socket falls back to reading the file
+            # and sending it in chunks.
+            self.wfile.flush()
+            self.connection.sendfile(f)
 
         logger.info(f'Returned requested image {local_file_name}')
 
@@ -105,40 +218,28 @@ class RequestHandler(BaseHTTPRequestHandler):
           Mozilla/5.0 (compatible; OpenGraph.io/1.1; +https://opengraph.io/;) AppleWebKit/537.36 (KHTML, like Gecko)  Chrome/51.0.2704.103 Safari/537.36
         :return: true if request was by a crawler
         """
-        user_agent = self.headers['User-Agent']
-        if user_agent:
-            user_agent = user_agent.lower()
-        return ('OpenGraph'.lower() in user_agent or
-                'Bluesky Cardyb'.lower() in user_agent)
+        user_agent = self.headers.get('User-Agent') or ''
+        return _CRAWLER_USER_AGENT_RE.search(user_agent) is not None
 
-    def _return_redirect_to_original_post(self) -> None:
+    def _return_redirect_to_original_post(self, post_type: PostType) -> None:
         """
         Sends back redirect to the original post path but using the original domain name.
         This way the user goes to the post when they click on the link.
+        :param post_type: type of the requested post
         """
-        path = urlparse(self.path).path
-        post_type = self._get_post_type(path)
-        match post_type:
-            case PostType.XITTER:
-                domain_name = 'x.com'
-            case PostType.BLUESKY:
-                domain_name = 'bsky.app'
-            case PostType.THREADS:
-                domain_name = 'threads.net'
-            case _:
-                domain_name = 'x.com'
+        domain_name = _ORIGINAL_DOMAINS.get(post_type, 'x.com')
 
         new_url = f'https://{domain_name}{self.path}'
         logger.info(f"Returning redirect to original post {new_url}")
         self._return_redirect(new_url)
 
     def _return_redirect(self, new_url: str) -> None:
-        msg = f'Redirecting to {new_url}'
-        response_body = bytes(msg, 'utf-8')
+        # No body since the Location header is all that is needed. Content-Length is still
+        # required so that the connection can be kept alive.
         self.send_response(302)
         self.send_header('Location', new_url)
+        self.send_header('Content-Length', '0')
         self.end_headers()
-        self.wfile.write(response_body)
 
     def _image_file_name(self, path: str) -> str:
         """
@@ -146,38 +247,54 @@ class RequestHandler(BaseHTTPRequestHandler):
         :param path: source of hash
         :return: file name of image associated with path
         """
-        # Make sure the directory has been created
-        os.makedirs(self._images_directory, exist_ok=True)
-
         return self._images_directory + '/' + stable_hash_str(path) + '.png'
 
     def _get_cache_filename(self, path: str) -> str:
         return self._cache_directory + '/' + stable_hash_str(path) + '_card.html'
 
-    def _get_card_from_cache(self, path: str) -> Optional[str]:
+    def _get_card_from_cache(self, path: str) -> Optional[bytes]:
+        """
+        Gets the cached card for the path, but only if it is not older than the configured
+        allowable_cache_file_age_hours. Recently used cards are kept in memory so that the cache
+        file doesn't need to be read again. The card is kept as utf-8 encoded bytes so that it
+        can be returned as is.
+        :param path:
+        :return: the card html bytes, or None if not cached or too old
+        """
+        cached_card = _card_memory_cache.get(path)
+        if cached_card:
+            html, expiry_time = cached_card
+            if time.time() < expiry_time:
+                logger.info(f'For path={path} using card cached in memory')
+                return html
+            _card_memory_cache.pop(path)
+
         filename = self._get_cache_filename(path)
 
         logger.info(f'Seeing if request path={path} is stored as cache file={filename}')
         try:
-            f = open(filename, "r")
-            html = f.read()
-            f.close()
-            logger.info(f'For path={path} using cache file={filename}')
-            return html
+            with open(filename, "rb") as f:
+                # If cache file too old then can't use it. Checked before reading the file so
+                # that a stale card isn't read just to be discarded.
+                expiry_time = _card_expiry_time(os.fstat(f.fileno()).st_mtime)
+                if time.time() >= expiry_time:
+                    logger.info(f'OpenGraph card was in cache but was too old to use. Therefore regenerating...')
+                    return None
+                html = f.read()
         except FileNotFoundError as e:
             # No cache file that could be opened
             return None
 
-    def _put_card_into_cache(self, path: str, html: str) -> None:
-        # Make sure cache directory exists
-        os.makedirs(self._cache_directory, exist_ok=True)
+        logger.info(f'For path={path} using cache file={filename}')
+        _card_memory_cache.put(path, (html, expiry_time))
+        return html
 
+    def _put_card_into_cache(self, path: str, html: bytes) -> None:
         # Store html into the file
         filename = self._get_cache_filename(path)
         try:
-            f = open(filename, "w")
-            f.write(html)
-            f.close()
+            _write_atomically(filename, lambda tmp_filename: _write_bytes(tmp_filename, html))
+            _card_memory_cache.put(path, (html, _card_expiry_time(os.path.getmtime(filename))))
         except FileNotFoundError as e:
             logger.error(f'Could not write cache file {filename} {str(e)}')
 
@@ -191,100 +308,46 @@ class RequestHandler(BaseHTTPRequestHandler):
         :param path: the path of the url used
         :return: the post type of BLUESKY, XITTER, or THREADS (or UNKNOWN)
         """
-        if "/status/" in path:
+        # Bluesky and Threads paths can be recognized by how they start, so check those first
+        # instead of scanning the whole path for each type of post
+        if path.startswith('/profile/'):
+            if '/post/' in path:
+                return PostType.BLUESKY
+        elif path.startswith('/@'):
+            if '/post/' in path:
+                return PostType.THREADS
+
+        if '/status/' in path:
             return PostType.XITTER
-        elif "/profile/" in path and "/post/" in path:
-            return PostType.BLUESKY
-        elif "/@" in path and "/post/" in path:
-            return PostType.THREADS
-        else:
-            return PostType.UNKNOWN
+        return PostType.UNKNOWN
 
-    def _return_open_graph_card(self) -> None:
-        # Determine the path. If there is a query string represented by a '?' then trim it off
-        # so that it doesn't complicate things. This is important because sometimes post URLs
-        # will include a query string with superfluous info.
-        path = urlparse(self.path).path
+    def _return_open_graph_card(self, path: str, post_type: PostType) -> None:
+        """
+        Returns the Open Graph card for the post, creating it if it is not already cached
+        :param path: path of the post, without any query string
+        :param post_type: type of the post
+        """
         logger.info(f'Will be returning Open Graph card for path={path}')
 
         try:
             # If cached card exists and it is not older than configured amount then use it
             cached_card_html = self._get_card_from_cache(path)
             if cached_card_html:
-                card_modified_time = os.path.getmtime(self._get_cache_filename(path))
-                current_time = time.time()
-                # If cache file not too old can use it
-                allowable_hours = int(config_values['allowable_cache_file_age_hours'])
-                if current_time < card_modified_time + allowable_hours * 60 * 60:
-                    logger.info(f'Returning cached opengraph card html=\n{cached_card_html}')
-                    return self._html_response(cached_card_html)
-                else:
-                    logger.info(f'OpenGraph card was in cach but was too old to use. Therefore regenerating...')
-
-            # Cached card doesn't exist so create it
-            # Get the html for rendering the post
-            post_type = self._get_post_type(path)
-            html = self._get_html_for_post(path, post_type)
-            if not html:
+                logger.info(f'Returning cached opengraph card for path={path}')
+                return self._html_response(cached_card_html)
+
+            # Cached card doesn't exist so create it. If another request is already creating the
+            # card for the same path, such as when several crawlers fetch a new post at the same
+            # time, then wait for that one instead of rendering the post again.
+            card_html_bytes = _create_card_once(path,
+                                                lambda: self._get_card_from_cache(path),
+                                                lambda: self._create_card(path, post_type))
+            if not card_html_bytes:
                 # This can happen when Twitter tries to get card before the url is correct.
                 # So it isn't truly an error to log.
                 logger.info(f'Could not get html for path={path} so returning error http response')
                 return self._error_response(f'Could not get html for path={path}')
-            logger.info(f'Obtained html for path={path} html=\n{html}')
-
-            self._write_html_to_tmp_file(html)
-            screenshot_image, shrinkage, likes_str, post_text = (
-                browser.get_screenshot_for_html(self._temp_file_url(), post_type))
-            self._erase_tmp_file()
-
-            # Save the image into the cache
-            image_local_file_name = self._image_file_name(path)
-            image_url = 'http://' + config_values['domain'] + '/' + image_local_file_name
-            screenshot_image.save(image_local_file_name)
-            logger.info(f'Stored image as file {image_local_file_name}')
-
-            # Generate the title to display. Currently Bluesky will output a title no matter what, so might
-            # as well make it useful. Bluesky also displays the domain name underneath. Therefore using
-            # 'Reposted via' as the title. And adding the number of likes if it is available. This is especially
-            # nice since trying to trim number of likes from the image of the post so that the image is not
-            # to tall.
-            title = f'{likes_str} - Posted by @{self._get_user(path)}'
-
-            # Determine if should add description to Open Graph card. Should be added if the post image
-            # had to be shrunk significantly, possibly making the text hard to read. Turns out the images
-            # displayed on mobile app are super tiny, so hard to read below even 0.8 shrinkage.
-            logger.info(f'image shrinkage = {shrinkage} for path={path}')
-            if shrinkage < 0.8:
-                description = post_text
-                title = title + ':'
-            else:
-                description = ''
-
-            # Determine the image size so that it can be returned in the link card (even though Bluesky
-            # currently doesn't use that info
-            width, height = screenshot_image.size
-
-            # Return the Open Graph card
-            card_html = f"""
-<html>
-<head>
-<!-- OpenGraph card for post {path} -->
-<meta property="og:title" content="{title}" />
-<meta name="twitter:title" content="{title}" /> 
-<meta property="og:description" content="{description}" />
-<meta property="og:image" content="{image_url}" />
- <!-- doesn't work on Bluesky et al so not truly needed-->
-<meta property="og:type" content="image" />
-<meta property="og:image:width" content="{width}" />
-<meta property="og:image:height" content="{height}" />
-</head>
-</html>"""
-
-            # Cache the card html in case accessed again
-            self._put_card_into_cache(path, card_html)
-
-            logger.info(f'returning opengraph card html={card_html}')
-            return self._html_response(card_html)
+            return self._html_response(card_html_bytes)
         except:
             msg = 'Exception for request ' + self.path + '\n' + traceback.format_exc()
             logger.error(msg)
@@ -292,44 +355,72 @@ class RequestHandler(BaseHTTPRequestHandler):
         finally:
             logger.debug(f'Done processing request {path}')
 
-    def _temp_file_url(self):
-        return 'file://' + os.path.abspath(self._temp_html_file_name)
-
-    def _write_html_to_tmp_file(self, html: str) -> None:
+    def _create_card(self, path: str, post_type: PostType) -> Optional[bytes]:
         """
-        Open tmp file but wait till file doesn't exit. This ensures that only one thread
-        can access the browser at a time
-        :param html:
+        Renders the post, stores the image, and creates the Open Graph card for it. The card is
+        also put into the cache.
+        :param path: path of the post
+        :param post_type: type of the post
+        :return: the card html as utf-8 encoded bytes, or None if the html for the post could not
+        be obtained
         """
-        logger.info(f'Will write html to tmp file {self._temp_html_file_name} once file freed up...')
-        f = None
-        start = time.time()
-        while not f:
-            try:
-                f = open(self._temp_html_file_name, "x")
-            except FileExistsError:
-                logger.info(f'NOTE: temp file {self._temp_html_file_name} already exists so waiting for '
-                            f'it to disappear, or for 20 secs...')
-                time.sleep(2.0)
-                if time.time() - start > 20.0:
-                    f = open(self._temp_html_file_name, "w")
-
-        f.write(html)
-        f.close()
-        logger.info(f'Wrote html to tmp file {self._temp_html_file_name}')
-
-    def _erase_tmp_file(self) -> None:
-        """
-        Erases the tmp file used to both store the html and to make sure that only single request
-        accesses the browser at a time. This should also be done at startup in case this program
-        terminated without cleaning up that file by erasing it.
-        :return:
-        """
-        logger.info(f'Erasing temp file {self._temp_html_file_name}')
-        try:
-            os.remove(self._temp_html_file_name)
-        except FileNotFoundError:
-            logger.info(f'There was no tmp file {self._temp_html_file_name} to erase')
+        # Get the html for rendering the post
+        html = self._get_html_for_post(path, post_type)
+        if not html:
+            return None
+        logger.info(f'Obtained html for path={path}')
+        # The whole html of the post is large so only format it when debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f'html for path={path} html=\n{html}')
+
+        screenshot_image, shrinkage, likes_str, post_text = browser.get_screenshot_for_html(html, post_type)
+
+        # Save the image into the cache. Using fast compression since the default zlib level
+        # takes much longer and only makes the file slightly smaller.
+        image_local_file_name = self._image_file_name(path)
+        image_url = _IMAGE_URL_PREFIX + image_local_file_name
+        _write_atomically(image_local_file_name,
+                          lambda tmp_filename: screenshot_image.save(tmp_filename, 'PNG', compress_level=1))
+        logger.info(f'Stored image as file {image_local_file_name}')
+
+        # Generate the title to display. Currently Bluesky will output a title no matter what, so might
+        # as well make it useful. Bluesky also displays the domain name underneath. Therefore using
+        # 'Reposted via' as the title. And adding the number of likes if it is available. This is especially
+        # nice since trying to trim number of likes from the image of the post so that the image is not
+        # to tall.
+        title = f'{likes_str} - Posted by @{escape(self._get_user(path, post_type) or "")}'
+
+        # Determine if should add description to Open Graph card. Should be added if the post image
+        # had to be shrunk significantly, possibly making the text hard to read. Turns out the images
+        # displayed on mobile app are super tiny, so hard to read below even 0.8 shrinkage.
+        logger.info(f'image shrinkage = {shrinkage} for path={path}')
+        if shrinkage < 0.8:
+            description = escape(post_text or "")
+            title = title + ':'
+        else:
+            description = ''
+
+        # Determine the image size so that it can be returned in the link card (even though Bluesky
+        # currently doesn't use that info
+        width, height = screenshot_image.size
+
+        # Return the Open Graph card. The path comes from the request so it is escaped too, so that
+        # a --> in it can't end the comment that it is put into.
+        card_html = _CARD_TEMPLATE.format(path=escape(path),
+                                          title=title,
+                                          description=description,
+                                          image_url=image_url,
+                                          width=width,
+                                          height=height)
+
+        # Cache the card html in case accessed again
+        card_html_bytes = card_html.encode('utf-8')
+        self._put_card_into_cache(path, card_html_bytes)
+
+        logger.info(f'Created opengraph card for path={path}')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f'opengraph card html={card_html}')
+        return card_html_bytes
 
     def _get_html_for_post(self, path: str, post_type: PostType) -> str:
         """
@@ -352,7 +443,7 @@ class RequestHandler(BaseHTTPRequestHandler):
                 logger_bad_requests.warn(f'{self.client_address[0]} : {msg}')
                 return ''
 
-    def _get_user(self, path: str) -> Optional[str]:
+    def _get_user(self, path: str, post_type: PostType) -> Optional[str]:
         """
         Determines and returns the username from the path. Handles Bluesky, Xitter, and Threads URLs
 
@@ -360,34 +451,29 @@ class RequestHandler(BaseHTTPRequestHandler):
         Bluesky post URL is like https://bsky.app/profile/skibu.bsky.social/post/3lcmchch6js2j
         Threads post URL is like https://www.threads.net/@lakota_man/post/DDXTHZ2Jr14
         :param path: the original URL path of the post
+        :param post_type: type of the post, as already determined from the path
         :return: username of post
         """
-        if "/status/" in path:
-            # Xitter path like "/becauseberkeley/status/1865482308008255873"
-            return path[1:path.find('/', 1)]
-        elif "/profile/" in path and "/post/" in path:
-            # Bluesky path like "/profile/skibu.bsky.social/post/3lcmchch6js2j"
-            return path[10:path.find('/', 10)]
-        elif "/@" in path and "/post/" in path:
-            # Threads pass like /@lakota_man/post/DDXTHZ2Jr14
-            return path[2:path.find('/', 2)]
-        else:
+        start = _USER_NAME_STARTS.get(post_type)
+        if start is None:
             # In case unknown command specified
             msg = f'Not a valid post path "{self.path}"'
             logger_bad_requests.warn(f'{self.client_address[0]} : {msg}')
             return None
 
-    def _parse_path(self, path: str, regex: str) -> tuple[str, str]:
+        return path[start:path.find('/', start)]
+
+    def _parse_path(self, path: str, pattern: re.Pattern) -> tuple[str, str]:
         """
-        Converts path to user_name, post_id using the specified regular expression.
+        Converts path to user_name, post_id using the specified precompiled regular expression.
         :param path:
-        :param regex:
+        :param pattern: the compiled regex for the type of post
         :return: user_name, post_id
         """
-        pattern = re.compile(regex)
-        groups = pattern.match(path).groups()
-        user_name = groups[0]
-        post_id = groups[1]
+        match = pattern.match(path)
+        if not match:
+            raise ValueError(f'Could not determine user name and post id from path={path}')
+        user_name, post_id = match.groups()[:2]
         return user_name, post_id
 
     def _xitter_post(self, path: str) -> str:
@@ -432,12 +518,12 @@ class RequestHandler(BaseHTTPRequestHandler):
 
         return get_threads_post_html(user_name, post_id)
 
-    def _html_response(self, msg: str) -> None:
+    def _html_response(self, msg: str | bytes) -> None:
         """
         For sending back html response
-        :param msg:
+        :param msg: the html, or the already utf-8 encoded html
         """
-        response_body = bytes(msg, 'utf-8')
+        response_body = msg if isinstance(msg, bytes) else bytes(msg, 'utf-8')
 
         self.send_response(200)
         self.send_header('Content-Type', 'html')
@@ -472,11 +558,153 @@ class RequestHandler(BaseHTTPRequestHandler):
         self.wfile.write(response_body)
 
 
+# Create the directories for the cached images and cards just once instead of for every request
+os.makedirs(RequestHandler._images_directory, exist_ok=True)
+os.makedirs(RequestHandler._cache_directory, exist_ok=True)
+
+
+def _create_card_once(path: str,
+                      get_cached_card: Callable[[], Optional[bytes]],
+                      create_card: Callable[[], Optional[bytes]]) -> Optional[bytes]:
+    """
+    Creates the card for the path, but if the card for the same path is already being created
+    by another thread then waits for that thread and uses its result instead. This way
+    concurrent requests for the same post only use a browser once.
+    :param path: path of the post
+    :param get_cached_card: for getting the card from the cache
+    :param create_card: for actually creating the card
+    :return: the result of create_card, which might be from another thread, or the cached card
+    """
+    with _cards_in_progress_lock:
+        future = _cards_in_progress.get(path)
+        is_creator = future is None
+        if is_creator:
+            # Another thread might have just finished creating the card after the caller found
+            # that it wasn't cached. Since the card is cached before the in progress entry is
+            # removed, checking the cache again while holding the lock catches that case.
+            cached_card = get_cached_card()
+            if cached_card:
+                return cached_card
+
+            future = Future()
+            _cards_in_progress[path] = future
+
+    if is_creator:
+        try:
+            future.set_result(create_card())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with _cards_in_progress_lock:
+                del _cards_in_progress[path]
+    else:
+        logger.info(f'Card for path={path} is already being created so waiting for it')
+
+    return future.result()
+
+
+def _card_expiry_time(modified_time: float) -> float:
+    """
+    :param modified_time: when the card was created
+    :return: the time after which the cached card is too old to be used
+    """
+    return modified_time + config_values.allowable_cache_file_age_hours * 60 * 60
+
+
+def _write_atomically(filename: str, write: Callable[[str], None]) -> None:
+    """
+    Writes a file by first writing to a uniquely named tmp file and then renaming it. This way
+    concurrent requests never read a partially written file, and two requests writing the same
+    file at the same time can't corrupt it.
+    :param filename: the file to write
+    :param write: function that writes the contents to the tmp file name passed to it
+    """
+    tmp_filename = f'{filename}.{os.urandom(4).hex()}.tmp'
+    try:
+        write(tmp_filename)
+        os.replace(tmp_filename, filename)
+    except:
+        # Don't leave the partial tmp file around
+        try:
+            os.remove(tmp_filename)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _write_bytes(filename: str, data: bytes) -> None:
+    with open(filename, "wb") as f:
+        f.write(data)
+
+
+def _image_etag(stat: os.stat_result) -> str:
+    """
+    The image only changes when the card is regenerated so the modified time and size
+    identify the version of the image
+    :param stat: of the image file
+    :return: the ETag for the image
+    """
+    return f'"{int(stat.st_mtime)}-{stat.st_size}"'
+
+
+class _WebServer(ThreadingHTTPServer):
+    """
+    ThreadingHTTPServer that limits how many connections are handled at the same time. Each
+    connection still gets its own daemon thread, so a slow client only ever holds up its own
+    connection and the threads never delay exiting. But when http_threads connections are
+    being handled no further connections are accepted until one finishes, so that a burst of
+    requests waits in the listen backlog instead of creating an unlimited number of threads.
+    Also, when there are multiple worker processes, lets each of them bind to the same port
+    so that the kernel distributes the connections among them.
+    """
+    def __init__(self, server_address, handler_class):
+        super().__init__(server_address, handler_class)
+        self._active_connections = 0
+        self._connections_changed = threading.Condition()
+
+    def server_bind(self):
+        if config_values.worker_processes > 1:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def process_request(self, request, client_address):
+        # Called by the thread that accepts connections, so waiting here for a free slot
+        # means that further connections are not accepted in the meantime
+        with self._connections_changed:
+            self._connections_changed.wait_for(
+                lambda: self._active_connections < config_values.http_threads)
+            self._active_connections += 1
+
+        try:
+            super().process_request(request, client_address)
+        except:
+            self._connection_done()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._connection_done()
+
+    def is_busy(self) -> bool:
+        """
+        :return: true if at least half of the allowed connections are in use, in which case
+        connections should not be kept alive
+        """
+        return self._active_connections * 2 >= config_values.http_threads
+
+    def _connection_done(self) -> None:
+        with self._connections_changed:
+            self._active_connections -= 1
+            self._connections_changed.notify()
+
+
 def _run() -> None:
     """
     Handles http requests
     """
-    httpd = ThreadingHTTPServer(('', config_values['http_port']), RequestHandler)
+    httpd = _WebServer(('', config_values.http_port), RequestHandler)
     httpd.serve_forever()
 
 
@@ -484,9 +712,9 @@ def _run_ssl() -> None:
     """
     Sets up Handling of https requests
     """
-    httpd = ThreadingHTTPServer(('', config_values['https_port']), RequestHandler)
+    httpd = _WebServer(('', config_values.https_port), RequestHandler)
     context = ssl.SSLContext(ssl.PROTOCOL_TLSv1_2)
-    context.load_cert_chain(config_values['certfile'], config_values['keyfile'])
+    context.load_cert_chain(config_values.certfile, config_values.keyfile)
     context.set_ciphers("@SECLEVEL=1:ALL")
     httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
 
@@ -496,8 +724,20 @@ def _run_ssl() -> None:
 def start_webserver() -> None:
     """
     Starts the webserver and then just waits forever. Handles both http and https.
+    If configured for multiple worker processes then the additional processes are forked
+    first, and each one has its own pool of browsers and its own web server threads.
     """
-    import threading
+    for _ in range(config_values.worker_processes - 1):
+        if os.fork() == 0:
+            # In the child process so don't fork any more
+            break
+
+    # Open the connections for getting the html of posts in the background, and start the
+    # headless browsers, so that the first requests don't have to wait for them. Done after
+    # forking since neither connections nor browsers can be shared between processes.
+    httpSession.warm_up()
+    browser_pool.prefill()
+
     http_thread = threading.Thread(target=_run)
     https_thread = threading.Thread(target=_run_ssl)
 
@@ -1,12 +1,17 @@
+import functools
 import hashlib
 
 
+@functools.lru_cache(maxsize=4096)
 def stable_hash_str(key: str) -> str:
     """
     A hash function that is consistent across restarts. That is of course important for file names for a cache.
+    Since the names of the image files are part of the image URLs already handed out in Open Graph cards
+    the hash algorithm must not change. The same path is hashed for both its card and its image, and
+    for repeated requests, so results are remembered.
     :param key: string to be hashed.
     :return: a 12 character hex hash string
     """
-    str_bytes = bytes(key, "UTF-8")
-    m = hashlib.md5(str_bytes)
-    return m.hexdigest()[:12].upper()
\ No newline at end of file
+    str_bytes = key.encode('utf-8')
+    m = hashlib.md5(str_bytes, usedforsecurity=False)
+    return m.hexdigest()[:12].upper()
@@ -0,0 +1,17 @@
+# Tests for creating the likes string of a post
+from likes import get_likes_str
+
+
+def test_valid_likes_get_a_heart():
+    assert get_likes_str('97') == '97 &#9825;'
+    assert get_likes_str('1.2K') == '1.2K &#9825;'
+
+
+def test_invalid_likes_are_ignored():
+    assert get_likes_str('') == ''
+    assert get_likes_str('0') == ''
+    assert get_likes_str('Reply') == ''
+
+
+def test_likes_are_escaped():
+    assert get_likes_str('1"><script>') == '1&quot;&gt;&lt;script&gt; &#9825;'
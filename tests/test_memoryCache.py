@@ -0,0 +1,58 @@
+# Tests for the in-memory LruCache
+import memoryCache
+from memoryCache import LruCache
+
+
+def test_evicts_least_recently_used():
+    cache = LruCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    # Using 'a' makes 'b' the least recently used, so 'b' is evicted when 'c' is added
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+
+def test_put_replaces_existing_value():
+    cache = LruCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('a', 2)
+    cache.put('b', 3)
+
+    assert cache.get('a') == 2
+    assert cache.get('b') == 3
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(memoryCache.time, 'monotonic', lambda: now)
+    cache = LruCache(max_entries=2, ttl=60)
+    cache.put('a', 1)
+
+    now = 1059.0
+    assert cache.get('a') == 1
+
+    now = 1060.0
+    assert cache.get('a') is None
+
+
+def test_entries_without_ttl_dont_expire(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(memoryCache.time, 'monotonic', lambda: now)
+    cache = LruCache(max_entries=2)
+    cache.put('a', 1)
+
+    now = 1000.0 + 365 * 24 * 60 * 60
+    assert cache.get('a') == 1
+
+
+def test_pop():
+    cache = LruCache(max_entries=2)
+    cache.put('a', 1)
+    cache.pop('a')
+    cache.pop('missing')
+
+    assert cache.get('a') is None
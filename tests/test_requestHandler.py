@@ -0,0 +1,51 @@
+# Tests for creating a card just once when it is requested concurrently
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import requestHandler
+
+
+def test_concurrent_callers_share_one_creation():
+    creating = threading.Event()
+    release = threading.Event()
+    created_card = []
+    create_count = 0
+
+    def create_card():
+        nonlocal create_count
+        create_count += 1
+        creating.set()
+        release.wait(5)
+        created_card.append(b'card')
+        return b'card'
+
+    def get_cached_card():
+        # Like the real cache, the card is available once it has been created
+        return created_card[0] if created_card else None
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        first = executor.submit(requestHandler._create_card_once, '/p', get_cached_card, create_card)
+        assert creating.wait(5)
+        second = executor.submit(requestHandler._create_card_once, '/p', get_cached_card, create_card)
+        # Give the second caller time to start waiting for the first one
+        threading.Event().wait(0.1)
+        release.set()
+
+        assert first.result(5) == b'card'
+        assert second.result(5) == b'card'
+
+    assert create_count == 1
+    assert '/p' not in requestHandler._cards_in_progress
+
+
+def test_failed_creation_can_be_retried():
+    def create_card():
+        raise ValueError('failed')
+
+    with pytest.raises(ValueError):
+        requestHandler._create_card_once('/error', lambda: None, create_card)
+
+    assert '/error' not in requestHandler._cards_in_progress
+    assert requestHandler._create_card_once('/error', lambda: None, lambda: b'card') == b'card'
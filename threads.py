@@ -1,21 +1,38 @@
 # For handling threads requests
 import logging
+import re
 
 import requests
 from selenium.common import NoSuchElementException
 from selenium.webdriver.chrome.webdriver import WebDriver
-from selenium.webdriver.common.by import By
+
+import httpSession
+from memoryCache import LruCache
 
 logger = logging.getLogger()
 
 
-def threads_post_regex():
+# For getting user_name and post_id from a threads post URL. This matches the user id by
+# including chars until a ? or end of string is found. Compiled just once.
+_THREADS_POST_RE = re.compile(r'/(\S+)/post/([^?]+)')
+
+
+# Session used for all requests to the Threads embed service, so that the connection to
+# threads.net is kept alive
+_session = httpSession.create_session('https://threads.net/')
+
+# Recently fetched html of posts, keyed by (user_name, post_id). Crawlers often request a post
+# several times before its card is cached, so this avoids fetching the same html again. Kept
+# only for an hour so that the html gets refreshed.
+_post_html_cache = LruCache(max_entries=512, ttl=60 * 60)
+
+
+def threads_post_regex() -> re.Pattern:
     """
      For getting user_name and post_id from a threads post URL
-    :return: the regex to use
+    :return: the precompiled regex to use
     """
-    # This matches the user id by including chars until a ? or end of string is found
-    return r'/(\S+)/post/([^?]+)'
+    return _THREADS_POST_RE
 
 
 def get_threads_post_html(user_name: str, post_id: str):
@@ -25,84 +42,83 @@ def get_threads_post_html(user_name: str, post_id: str):
     :param post_id: of the post
     :return: the html for the post
     """
+    html = _post_html_cache.get((user_name, post_id))
+    if html:
+        logger.info(f'Using remembered threads html for user_name={user_name} post_id={post_id}')
+        return html
+
     # Get URL that provides HTML for the post. Using threads's embed service, which returns
     # the needed html for the post.
     url = f'https://threads.net/{user_name}/post/{post_id}/embed'
-    response = requests.get(url)
-    return response.text
-
-
-def get_threads_likes_str(browser: WebDriver) -> str:
+    try:
+        response = _session.get(url, timeout=httpSession.TIMEOUT)
+    except requests.RequestException as e:
+        logger.error(f'Could not get threads html from url={url}. {e}')
+        return None
+
+    html = response.text
+    # Only remember a successful response so that an error page isn't used for an hour
+    if response.ok:
+        _post_html_cache.put((user_name, post_id), html)
+    return html
+
+
+# Script that gets, in a single call, everything needed from the threads post: the likes text,
+# the post text, and the positions needed for cropping the post. The post is cut off at the
+# action bar since it isn't important. Positions are relative to the document. Returns null if
+# the OuterContainer of the post could not be found.
+_THREADS_INFO_JS = """
+    const rect = (element) => {
+        const r = element.getBoundingClientRect();
+        return {x: r.left + window.scrollX, y: r.top + window.scrollY, width: r.width, height: r.height};
+    };
+    const main = document.querySelector('.OuterContainer');
+    if (!main) return null;
+    const likes = document.querySelector('.MetadataContainer');
+    const text = document.querySelector('.BodyTextContainer');
+    const actionBar = document.querySelector('.ActionBarContainer');
+    return {likes: likes ? likes.innerText : '',
+            text: text ? text.innerText : '',
+            mainRect: rect(main),
+            actionBarY: actionBar ? rect(actionBar).y : null};
+"""
+
+
+def get_threads_post_info(browser: WebDriver) -> tuple[str, str, tuple[int, int, int, int]]:
     """
-    Returns number of likes for a threads post. Determines the number by searching XPATH of html
-    for what *appears* to be number of likes.
+    Gets the likes string, the post text, and the rectangle of the important part of a threads
+    post. Everything is read using a single script, which is much faster than separately finding
+    each element and then reading its text or position.
+    The rectangle uses the least amount of height possible since BlueSky uses fixed aspect ratio
+    for Open Graph cards and if the post is too tall then the image is shrunk down too much. The
+    units of the rectangle are browser pixels, as used for the clip of the screenshot.
     :param browser: so can talk with headless browser
-    :return: a string like "97 likes"
+    :return: likes_str like "97 likes", post_text, and the (left, top, right, bottom) coordinates
+    of the important part of the image that should be kept
     """
-    logger.info(f'Getting likes string for threads post')
+    logger.info(f'Getting likes, text, and crop rect for threads post')
 
-    # Find the html element that contains number of likes
-    likes_span_element = browser.find_element(By.CLASS_NAME, "MetadataContainer")
+    info = browser.execute_script(_THREADS_INFO_JS)
+    if not info:
+        raise NoSuchElementException('No OuterContainer found for threads post')
 
-    if likes_span_element:
-        # Find the likes in the html <span> element
-        try:
-            likes_str = browser.execute_script("return arguments[0].innerText", likes_span_element)
-            logger.info(f'Found the likes string={likes_str}')
-            return likes_str
-        except NoSuchElementException as e:
-            logger.info(f'Could not find the threads likes MetadataContainer element')
+    likes_str = info['likes']
+    if likes_str:
+        logger.info(f'Found the likes string={likes_str}')
 
-    # Could not be determined
-    return ''
+    post_text = info['text']
+    if post_text:
+        logger.info(f'Found the post text={post_text}')
 
+    main_rect = info['mainRect']
+    left = main_rect['x'] - 2
+    right = left + main_rect['width'] - 37
 
-def get_threads_post_text(browser: WebDriver) -> str:
-    """
-    Gets the post text for a threads post.
-    :param browser: so can talk with headless browser
-    :return: post text
-    """
-    logger.info(f'Getting text for threads post')
-
-    # Find the html element that contains the context
-    post_text_element = browser.find_element(By.CLASS_NAME, "BodyTextContainer")
-
-    if post_text_element:
-        # Find the likes in the html <span> element
-        try:
-            post_text = browser.execute_script("return arguments[0].innerText", post_text_element)
-            logger.info(f'Found the post text={post_text}')
-            return post_text
-        except NoSuchElementException as e:
-            logger.info(f'Could not find the threads BodyTextContainer element')
-
-    # Could not be determined
-    return ''
-
-
-def get_threads_rect(ratio: float, browser: WebDriver):
-    """
-    Gets the rectangle of the important part of the post. Want to use the least amount of height
-    possible since BlueSky uses fixed aspect ratio for Open Graph cards and if the post is too
-    tall then the image is shrunk down too much. The units are in screen pixels
-    :param ratio: the peculiar pixel ratio to map from Image pixels to browser pixels
-    :param browser: so can talk with headless browser
-    :return:left, top, right, bottom, the coordinates of the important part of the image that should be kept
-    """
-    # Find the html element that contains the context
-    main_container = browser.find_element(By.CLASS_NAME, 'OuterContainer')
-    main_rect = main_container.rect
-    left = (main_rect['x'] - 2) * ratio
-    right = left + ((main_rect['width'] - 37) * ratio)
-
-    top = (main_rect['y'] - 1) * ratio
-    action_bar_container = browser.find_element(By.CLASS_NAME, "ActionBarContainer")
-    if action_bar_container:
-        bottom = top + (action_bar_container.location['y'] - 16) * ratio
+    top = main_rect['y'] - 1
+    if info['actionBarY'] is not None:
+        bottom = top + info['actionBarY'] - 16
     else:
-        bottom = top + ((main_container['height'] - 16) * ratio)
+        bottom = top + main_rect['height'] - 16
 
     logger.info(f'Threads crop rect is left={left}, top={top}, right={right}, bottom={bottom}')
-    return round(left), round(top), round(right), round(bottom)
-
+    return likes_str, post_text, (round(left), round(top), round(right), round(bottom))
@@ -1,22 +1,47 @@
 # For handling twitter requests
-import json
 import logging
+import re
 from json import JSONDecodeError
+from urllib.parse import urlencode
 
 import requests
-from selenium.common import NoSuchElementException
 from selenium.webdriver.chrome.webdriver import WebDriver
-from selenium.webdriver.common.by import By
+from selenium.webdriver.remote.webelement import WebElement
+
+import httpSession
+from likes import get_likes_str
+from memoryCache import LruCache
+
+# Use the much faster orjson parser if it is available. Otherwise fall back to standard json.
+# Both accept the raw response bytes, and orjson's decode error is a subclass of the standard one.
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
 
 logger = logging.getLogger()
 
 
-def twitter_post_regex():
+# For getting user_name and post_id from a twitter post URL. Compiled just once.
+_TWITTER_POST_RE = re.compile(r'/(\S+)/status/(\S+)')
+
+
+# Session used for all requests to the Twitter oembed service, so that the connection to
+# publish.twitter.com is kept alive
+_session = httpSession.create_session('https://publish.twitter.com/')
+
+# Recently fetched html of posts, keyed by (user_name, post_id). Crawlers often request a post
+# several times before its card is cached, so this avoids fetching the same html again. Kept
+# only for an hour so that the html gets refreshed.
+_post_html_cache = LruCache(max_entries=512, ttl=60 * 60)
+
+
+def twitter_post_regex() -> re.Pattern:
     """
      For getting user_name and post_id from a twitter post URL
-    :return: the regex to use
+    :return: the precompiled regex to use
     """
-    return r'/(\S+)/status/(\S+)'
+    return _TWITTER_POST_RE
 
 
 def get_twitter_post_html(user_name: str, post_id: str):
@@ -26,138 +51,113 @@ def get_twitter_post_html(user_name: str, post_id: str):
     :param post_id: of the post
     :return: the html for the post
     """
+    html = _post_html_cache.get((user_name, post_id))
+    if html:
+        logger.info(f'Using remembered twitter html for user_name={user_name} post_id={post_id}')
+        return html
+
     # Get URL that provides HTML for the post. Using Twitter's oembed service, which returns
     # a json object with a html member.
     # Note: using hide_thread=false so that can also see the post being replied to, which
     # is nice for seeing context. But this takes extra vertical space so might want to set
     # this true.
-    url = (f'https://publish.twitter.com/oembed?' +
-           f'url=https://twitter.com/{user_name}/status/{post_id}')
-    url = url + '&hide_thread=false'
-    url = url + '&theme=dark'
+    # The post URL is encoded since it is itself a query parameter.
+    query = urlencode({'url': f'https://twitter.com/{user_name}/status/{post_id}',
+                       'hide_thread': 'false',
+                       'theme': 'dark'})
+    url = f'https://publish.twitter.com/oembed?{query}'
 
     logger.info(f'Getting twitter html by getting url={url}')
-    response = requests.get(url)
     try:
-        json_result = json.loads(response.content)
-        return json_result['html']
-    except JSONDecodeError as e:
-        logger.error(f'Could not parse twitter json. {e}')
+        response = _session.get(url, timeout=httpSession.TIMEOUT)
+    except requests.RequestException as e:
+        logger.error(f'Could not get twitter html from url={url}. {e}')
+        return None
 
-
-def get_twitter_likes_str(browser: WebDriver) -> str:
-    """
-    Returns string indicating number of likes for a tweet. Determines the number by searching XPATH
-    of html for what *appears* to be number of likes.
-    :param browser: so can talk with headless browser
-    :return: a string like "97 &hearts;"
-    """
-    logger.info(f'Getting likes string for twitter post')
-
-    # Initialize return value
-    likes_str = ''
-
-    # Need to just look within the iframe
-    iframe = browser.find_element(By.TAG_NAME, "iframe")
-    browser.switch_to.frame(iframe)
+    if not response.ok:
+        logger.error(f'Could not get twitter html from url={url}. status_code={response.status_code}')
+        return None
 
     try:
-        # Find the html element that contains number of likes
-        xpath_str = '//article/div/a/div/span'
-        likes_span_element = browser.find_element(By.XPATH, xpath_str)
-
-        if likes_span_element:
-            # Find the likes in the html <span> element
-            likes_number = browser.execute_script("return arguments[0].innerText", likes_span_element)
-
-            # Make sure the likes number wasn't actually a match to one of the other elements, one that
-            # doesn't start with a number. And make sure not blank.
-            if likes_number and '1' <= likes_number[0] <= '9':
-                # Value number so return it as the likes string
-                likes_str = f'{likes_number} &#9825;'  # &#9825; is heart outline
-                logger.info(f'Found the likes string={likes_str}')
-    except NoSuchElementException as e:
-        logger.info(f'Could not find the twitter likes <span> element specified by XPATH={xpath_str}')
-
-    # Switch back to the main frame so that subsequent software not confused
-    browser.switch_to.default_content()
-
-    # Done
-    return likes_str
-
-
-def get_twitter_post_text(browser: WebDriver) -> str:
+        html = _json_loads(response.content)['html']
+    except (JSONDecodeError, KeyError) as e:
+        logger.error(f'Could not parse twitter json from url={url}. {e!r}')
+        return None
+
+    # Only remember a successful response so that an error isn't used for an hour
+    _post_html_cache.put((user_name, post_id), html)
+    return html
+
+
+# Script run within the twitter iframe that gets, in a single call, everything needed from the
+# post: the likes text, the post text, and the positions needed for cropping the post. Likes are
+# in what *appears* to be the span at article/div/a/div/span and the post text is in the span at
+# article/div/div/span. The top of the post is the first div in the <article> and the post is cut
+# off at the <time> element since time and remaining info not important. Positions are relative
+# to the document and are null if the element could not be found.
+_TWITTER_INFO_JS = """
+    const y = (element) => element ? element.getBoundingClientRect().top + window.scrollY : null;
+    const article = document.querySelector('article');
+    const likes = article?.querySelector(':scope > div > a > div > span');
+    const text = article?.querySelector(':scope > div > div > span');
+    return {likes: likes ? likes.innerText : '',
+            text: text ? text.innerText : '',
+            articleHeight: article ? article.getBoundingClientRect().height : null,
+            divY: y(article?.querySelector('div')),
+            timeY: y(article?.querySelector('time'))};
+"""
+
+
+def get_twitter_post_info(browser: WebDriver,
+                          iframe: WebElement,
+                          iframe_rect: dict) -> tuple[str, str, tuple[int, int, int, int]]:
     """
-    Gets the post text for a twitter post.
+    Gets the likes string, the post text, and the rectangle of the important part of a twitter
+    post. Everything within the iframe is read using a single script, which is much faster than
+    separately finding each element and then reading its text or position.
+    The rectangle uses the least amount of height possible since BlueSky uses fixed aspect ratio
+    for Open Graph cards and if the post is too tall then the image is shrunk down too much. The
+    units of the rectangle are browser pixels, as used for the clip of the screenshot.
     :param browser: so can talk with headless browser
-    :return: post text
+    :param iframe: the iframe that contains the post, as already found when waiting for it to load
+    :param iframe_rect: position and size of the iframe, as x, y, width, and height
+    :return: likes_str like "97 &#9825;", post_text, and the (left, top, right, bottom) coordinates
+    of the important part of the image that should be kept
     """
-    logger.info(f'Getting text for twitter post')
-
-    # The return value
-    post_text = ''
+    logger.info(f'Getting likes, text, and crop rect for twitter post')
 
-    # Need to just look within the iframe
-    iframe = browser.find_element(By.TAG_NAME, "iframe")
+    # Read everything from within the iframe. Switch back to the main frame afterwards
+    # so that subsequent software not confused.
     browser.switch_to.frame(iframe)
+    try:
+        info = browser.execute_script(_TWITTER_INFO_JS)
+    finally:
+        browser.switch_to.default_content()
 
-    # Find the html element that contains text of the main post
-    xpath_str = '//article/div/div/span'
-    post_text_span_element = browser.find_element(By.XPATH, xpath_str)
-    if post_text_span_element:
-        # Find the text of the post in the html <span> element
-        try:
-            post_text = browser.execute_script("return arguments[0].innerText", post_text_span_element)
-            if post_text:
-                logger.info(f'Found post text={post_text}')
-        except NoSuchElementException as e:
-            logger.info(f'Could not find the post text <span> element specified by XPATH={xpath_str}')
-
-    # Switch back to the main frame so that subsequent software not confused
-    browser.switch_to.default_content()
-
-    # Could not determine number of likes
-    return post_text
+    likes_str = get_likes_str(info['likes'])
 
-
-def get_twitter_rect(ratio: float, browser: WebDriver):
-    """
-    Gets the rectangle of the important part of the post. Want to use the least amount of height
-    possible since BlueSky uses fixed aspect ratio for Open Graph cards and if the post is too
-    tall then the image is shrunk down too much. The units are in screen pixels
-    :param ratio: the peculiar pixel ratio to map from Image pixels to browser pixels
-    :param browser: so can talk with headless browser
-    :return:left, top, right, bottom, the coordinates of the important part of the image that should be kept
-    """
-    # Determine the main <article> element
-    iframe = browser.find_element(By.TAG_NAME, 'iframe')
+    post_text = info['text']
+    if post_text:
+        logger.info(f'Found post text={post_text}')
 
     # Determine left and right of the post. Adjusting left and right slightly to
     # not include the border, since it is visually distracting.
-    iframe_rect = iframe.rect
-    left = (iframe_rect['x'] + 1) * ratio
-    right = left + ((iframe_rect['width'] -2) * ratio)
+    left = iframe_rect['x'] + 1
+    right = left + iframe_rect['width'] - 2
 
-    browser.switch_to.frame(iframe)
-    article = browser.find_element(By.TAG_NAME, 'article')
-    if article:
+    if info['articleHeight'] is not None:
         # Use first div in the article to get the top position
-        div = article.find_element(By.TAG_NAME, 'div')
-        top = (iframe_rect['y'] + div.location['y'] - 3) * ratio
+        top = iframe_rect['y'] + (info['divY'] or 0) - 3
 
         # Use time element to can cut off the post there since time and remaining info not important
-        time = article.find_element(By.TAG_NAME, 'time')
-        if time:
-            bottom = (iframe_rect['y'] + time.location['y'] - 5) * ratio
+        if info['timeY'] is not None:
+            bottom = iframe_rect['y'] + info['timeY'] - 5
         else:
-            bottom = top + ((article.rect['height'] - 2) * ratio)
+            bottom = top + info['articleHeight'] - 2
     else:
         # No <article> element so use size of iframe
-        top = iframe_rect['y'] * ratio
-        bottom = top + (iframe_rect['height'] * ratio)
-
-    # Switch back to the main frame so that subsequent software not confused
-    browser.switch_to.default_content()
+        top = iframe_rect['y']
+        bottom = top + iframe_rect['height']
 
     logger.info(f'Twitter crop rect is left={left}, top={top}, right={right}, bottom={bottom}')
-    return round(left), round(top), round(right), round(bottom)
+    return likes_str, post_text, (round(left), round(top), round(right), round(bottom))